@@ -1,7 +1,9 @@
+import os
+
 RUBRICS_PROMPT_PATH = 'prompts/rubrics.txt'
 GENERATOR_PROMPT_PATH = 'prompts/generator.txt'
 CRITIC_PROMPT_PATH = 'prompts/critic.txt'
-LLM_OPTIONS = [
+LLM_OPTIONS: tuple[str, ...] = (
     # "ollama:gpt-oss:20b",
     # "ollama:qwen3:8b",
     # "ollama:qwen3:30b-a3b",
@@ -10,6 +12,42 @@ LLM_OPTIONS = [
     "google-genai:gemini-2.5-pro",
     # "anthropic:claude-4-sonnet",
     # "anthropic:claude-3-haiku",
-]
+)
+LLM_OPTIONS_SET = frozenset(LLM_OPTIONS)
 MAX_ITER = 5
-MAX_AGENT_ITER = 10
\ No newline at end of file
+# Rounds the workflow may spend on each kind of outcome before it returns the latest
+# TikZ; critic rejections get MAX_ITER, dead ends (no code, compile errors) less
+ITER_BUDGETS = {"no_code": 2, "compile_fail": 3, "aspect_ratio": 2, "critic_reject": MAX_ITER}
+# Parallel first-round generator samples. 1 (the default) keeps the loop fully
+# sequential; more is opt-in, since every extra sample is another generator call
+NUM_CANDIDATES = max(1, int(os.environ.get("ARCHGEN_NUM_CANDIDATES", "1")))
+# When several first-round candidates render, the critic compares them all in one call
+# and its pick (with its critique) replaces the first separate critic round. Only
+# matters with NUM_CANDIDATES > 1
+BATCHED_CANDIDATE_CRITIQUE = False
+# Draft the next generator revision while the critic reviews. Saves a round-trip per
+# rejected iteration, but each draft only sees the critique from the round before
+SPECULATIVE_REVISION = False
+MAX_AGENT_ITER = 10
+MAX_HISTORY_TURNS = 4  # user/assistant turns an agent keeps besides its instruction prompt
+# Per-request LLM timeouts in seconds; providers back off exponentially between retries
+LLM_TIMEOUTS = {
+    "google-genai:gemini-2.5-flash": 60,
+    "google-genai:gemini-2.5-flash-lite": 60,
+    "google-genai:gemini-2.5-pro": 180,
+    "anthropic:claude-4-sonnet": 120,
+}
+LLM_DEFAULT_TIMEOUT = 300  # local Ollama models can be slow on CPU
+LLM_MAX_RETRIES = 3
+# Client-side cache of agent replies for identical conversations, in seconds. Off by
+# default: with it, generating again with the same input replays the same replies
+# instead of sampling new ones. Set ARCHGEN_LLM_CACHE_TTL to opt in
+LLM_RESPONSE_CACHE_TTL = float(os.environ.get("ARCHGEN_LLM_CACHE_TTL", "0"))
+LLM_RESPONSE_CACHE_SIZE = 256
+# On-disk caches (rendered diagrams, LLM replies)
+CACHE_DIR = os.environ.get("ARCHGEN_CACHE_DIR", "cache")
+# Images sent to the LLMs are downscaled to this long edge and re-encoded to fit the byte budget
+LLM_IMAGE_MAX_EDGE = 1024
+LLM_IMAGE_MAX_BYTES = 200 * 1024
+# Dump full prompts, replies and LaTeX logs to stdout (large; off unless debugging)
+VERBOSE_LOGS = os.environ.get("ARCHGEN_VERBOSE_LOGS", "0") not in ("", "0", "false", "False")
@@ -1,7 +1,8 @@
 """ArchGen package initialization."""
 
-from .diagram import render_graph
+from .diagram import render_graph, arender_graph
 
 __all__ = [
     "render_graph",
+    "arender_graph",
 ]
@@ -1,28 +1,214 @@
 from __future__ import annotations
 
+import asyncio
 import gradio as gr
+import hmac
 import os
-import base64
-from dotenv import load_dotenv
-from frontend.diagram import render_graph, render_graph_stream
-from frontend.exporters import save_outputs
-from frontend.presets import PRESETS
-from constants import LLM_OPTIONS
-from vector_db.index import add_documents_to_vector_db, is_vector_db_ready, get_vector_db_error
-
-load_dotenv()  # Load environment variables from .env file if present
+import re
+import threading
+import time
+from collections import deque
+from functools import cache
+from frontend.diagram import render_graph, arender_graph_stream
+from frontend.exporters import save_outputs, OUTPUT_ROOT
+from frontend.cache import cache_key, get_cached_outputs, store_outputs
+from frontend.preview import build_preview_html
+from frontend.presets import PRESETS, PRESET_KEYS, DEFAULT_PRESET
+from constants import LLM_OPTIONS, LLM_OPTIONS_SET, VERBOSE_LOGS
+
+_LLM_CHOICES = list(LLM_OPTIONS)
+_DEFAULT_LLM = LLM_OPTIONS[0]
+
+# Log events are pushed to the UI in batches: after this many events, or once the
+# stream has been quiet for this long
+LOG_BATCH_EVENTS = 8
+LOG_BATCH_SECONDS = 0.025
+# Only the most recent log lines of a run are kept in the log panel
+LOG_MAX_ENTRIES = 500
+
+# Stop events of the generations in flight, by Gradio session, so Stop only ends the
+# run of the session that pressed it
+_RUN_STOPS: "dict[str, threading.Event]" = {}
+
+_ENV_LOADED = False
+_ADMIN_SECRET = None  # (is_bcrypt_hash, secret bytes)
+
+def _load_env():
+    """Load environment variables from .env (if present) once, on first interface build."""
+    global _ENV_LOADED
+    if not _ENV_LOADED:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _ENV_LOADED = True
+
+@cache
+def _vdb():
+    """vector_db.index, imported on first use: importing it starts the DB connection
+    and loads the embedding stack."""
+    import vector_db.index
+    return vector_db.index
+
+def _admin_secret():
+    """Admin secret from the environment, looked up on the first login attempt only.
+
+    ADMIN_PASSWORD_HASH (a bcrypt hash) takes precedence over plain ADMIN_PASSWORD.
+    """
+    global _ADMIN_SECRET
+    if _ADMIN_SECRET is None:
+        hashed = os.getenv("ADMIN_PASSWORD_HASH")
+        if hashed:
+            _ADMIN_SECRET = (True, hashed.encode())
+        else:
+            _ADMIN_SECRET = (False, (os.getenv("ADMIN_PASSWORD") or "").encode())
+    return _ADMIN_SECRET
+
+def _admin_password_ok(pw):
+    is_hash, secret = _admin_secret()
+    if not secret or not pw:
+        return False
+    if is_hash:
+        import bcrypt  # only required when a hashed password is configured
+        return bcrypt.checkpw(pw.encode(), secret)
+    # Constant-time comparison to avoid leaking the password through timing
+    return hmac.compare_digest(pw.encode(), secret)
+
+_DB_STATUS = (None, 0.0)  # (status text, monotonic time it was computed)
+DB_STATUS_TTL = 5.0
+DB_STATUS_READY_TTL = 30.0
 
 def get_db_status():
-    if is_vector_db_ready():
+    """DB status text, recomputed at most every few seconds across all sessions."""
+    global _DB_STATUS
+    cached, checked_at = _DB_STATUS
+    now = time.monotonic()
+    if cached is not None:
+        ttl = DB_STATUS_READY_TTL if cached.startswith("✅") else DB_STATUS_TTL
+        if now - checked_at < ttl:
+            return cached
+    status = _compute_db_status()
+    _DB_STATUS = (status, now)
+    return status
+
+def _compute_db_status():
+    vdb = _vdb()
+    if vdb.is_vector_db_ready():
         return "✅ Vector DB: Ready"
-    error = get_vector_db_error()
+    error = vdb.get_vector_db_error()
     if error:
         return f"❌ Vector DB: Error - {error}"
     else:
         return "⏳ Vector DB: Initializing..."
 
-def update_display(status):
-    return status
+DB_STATUS_POLL_SECONDS = 0.5
+DB_STATUS_WAIT_SECONDS = 600
+
+async def _await_db_status():
+    """Resolve to the DB status once initialization has finished.
+
+    Waits server-side on the init flag, so each page load costs one update
+    instead of a client timer polling for the lifetime of the session.
+    """
+    vdb = _vdb()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + DB_STATUS_WAIT_SECONDS
+    while not vdb.is_vector_db_init_done() and loop.time() < deadline:
+        await asyncio.sleep(DB_STATUS_POLL_SECONDS)
+    return _compute_db_status()
+
+def _warm_presets():
+    """Render every preset with the default provider so untouched presets hit the cache."""
+    for name, code_text in PRESETS.items():
+        if not code_text.strip():
+            continue
+        key = cache_key(code_text, _DEFAULT_LLM)
+        if get_cached_outputs(key) is not None:
+            continue
+        try:
+            store_outputs(key, render_graph(code_text, _DEFAULT_LLM, want_jpeg=True))
+        except Exception as e:
+            print(f"[ERROR] Warming preset {name} failed: {e}")
+
+async def _cached_events(outputs):
+    """Replay a cached render as the same events render_graph_stream would emit."""
+    yield {"type": "log", "text": "[cache] Reusing previously rendered diagram for this code and provider."}
+    if outputs.get("tex"):
+        yield {"type": "tikz", "tikz": outputs["tex"].decode("utf-8", errors="ignore"), "stage": "compiled"}
+    yield {"type": "final", "outputs": outputs}
+
+async def _batch_logs(events):
+    """Merge bursts of log events into {"type": "logs", "texts": [...]} events.
+
+    Pending logs are flushed when LOG_BATCH_EVENTS have piled up, when no event
+    arrives within LOG_BATCH_SECONDS, and before any non-log event.
+    """
+    it = events.__aiter__()
+    pending = []
+    nxt = None
+    try:
+        while True:
+            if nxt is None:
+                nxt = asyncio.ensure_future(it.__anext__())
+            if pending:
+                done, _ = await asyncio.wait({nxt}, timeout=LOG_BATCH_SECONDS)
+                if not done:
+                    yield {"type": "logs", "texts": pending}
+                    pending = []
+                    continue
+            try:
+                evt = await nxt
+            except StopAsyncIteration:
+                break
+            finally:
+                nxt = None
+            if isinstance(evt, dict) and evt.get("type") == "log":
+                pending.append(evt.get("text", ""))
+                if len(pending) >= LOG_BATCH_EVENTS:
+                    yield {"type": "logs", "texts": pending}
+                    pending = []
+                continue
+            if pending:
+                yield {"type": "logs", "texts": pending}
+                pending = []
+            yield evt
+        if pending:
+            yield {"type": "logs", "texts": pending}
+    finally:
+        if nxt is not None:
+            nxt.cancel()
+
+_BANNER_MD = """
+# ArchGen
+Paste or select a PyTorch nn.Module to generate an architecture diagram.
+
+<span style='color:orange; font-weight:bold;'>⚠️ Please note: Generation may take up to a few minutes depending on model and server load.</span>
+"""
+
+_CITATION_MD = """
+## Citation
+If you use ArchGen in your research or teaching, please cite:
+
+```
+@software{jiang_archgen_2025,
+  author    = {Zhiheng Jiang},
+  title     = {ArchGen: Automated Neural Network Architecture Diagram Generation},
+  year      = {2025},
+  url       = {https://github.com/jzh001/ArchGen},
+  license   = {Apache-2.0},
+  note      = {Version: latest}
+}
+```
+
+---
+## References
+- [NNTikZ - TikZ Diagrams for Deep Learning and Neural Networks](https://github.com/fraserlove/nntikz)  \
+    Fraser Love, 2024. GitHub repository.  \
+    `@misc{love2024nntikz, author = {Fraser Love}, title = {NNTikZ - TikZ Diagrams for Deep Learning and Neural Networks}, year = 2024, url = {https://github.com/fraserlove/nntikz}, note = {GitHub repository} }`
+- [Collection of LaTeX resources and examples](https://github.com/davidstutz/latex-resources)  \
+    David Stutz, 2022. GitHub repository.  \
+    `@misc{Stutz2022, author = {David Stutz}, title = {Collection of LaTeX resources and examples}, publisher = {GitHub}, journal = {GitHub repository}, howpublished = {\\url{https://github.com/davidstutz/latex-resources}}, note = {Accessed on MM.DD.YYYY}}`
+- [tikz.net](https://tikz.net)  \
+    A collection of TikZ examples and resources.
+"""
 
 CSS = """
 /* Controls card */
@@ -70,30 +256,24 @@ CSS = """
 #downloads .container, #downloads .wrap, #downloads .prose, #downloads .grid, #downloads .file-preview { border: 0 !important; background: transparent !important; }
 """
 
-def build_interface():
-    with gr.Blocks(title="ArchGen", css=CSS) as demo:
-        gr.Markdown(
-            """
-            # ArchGen
-            Paste or select a PyTorch nn.Module to generate an architecture diagram.
+# Comments and whitespace stripped once at import; Gradio inlines the CSS into every page
+_CSS_MIN = re.sub(r"\s+", " ", re.sub(r"/\*.*?\*/", "", CSS, flags=re.S)).strip()
 
-            <span style='color:orange; font-weight:bold;'>⚠️ Please note: Generation may take up to a few minutes depending on model and server load.</span>
-            """
-        )
+def build_interface():
+    _load_env()
+    # Serve previews straight from disk instead of inlining them as data URIs
+    gr.set_static_paths(paths=[OUTPUT_ROOT])
+    with gr.Blocks(title="ArchGen", css=_CSS_MIN) as demo:
+        gr.Markdown(_BANNER_MD)
 
         db_status = gr.Markdown(value=get_db_status())
-        db_status_state = gr.State(value=get_db_status())
-
-        # Persistent states for loading and results
-        loading_state = gr.State(False)
-        result_state = gr.State(None)
 
         with gr.Tabs():
             with gr.TabItem("Generate Diagram"):
                 # Controls: preset & provider on one row, then the button below
                 with gr.Row(elem_id="controls_row"):
-                    preset = gr.Dropdown(choices=list(PRESETS.keys()), value="SimpleMLP", label="Preset Model")
-                    provider = gr.Dropdown(choices=LLM_OPTIONS, value=LLM_OPTIONS[0], label="LLM Provider")
+                    preset = gr.Dropdown(choices=PRESET_KEYS, value=DEFAULT_PRESET, label="Preset Model")
+                    provider = gr.Dropdown(choices=_LLM_CHOICES, value=_DEFAULT_LLM, label="LLM Provider")
                 with gr.Row():
                     generate_btn = gr.Button("Generate", variant="primary", elem_id="generate_btn")
                     stop_btn = gr.Button("Stop", variant="secondary", visible=False)
@@ -101,7 +281,7 @@ def build_interface():
                 # Side-by-side: left column (input + latest TikZ), right column (logs)
                 with gr.Row():
                     with gr.Column(scale=6, elem_id="code_col"):
-                        code = gr.Code(label="PyTorch nn.Module code", language="python", value=PRESETS["SimpleMLP"], lines=20, max_lines=20)
+                        code = gr.Code(label="PyTorch nn.Module code", language="python", value=PRESETS[DEFAULT_PRESET], lines=20, max_lines=20)
                         latest_tikz = gr.Code(label="Latest TikZ Code", language="latex", value="% Latest TikZ will appear here during generation", lines=20, max_lines=20)
                     with gr.Column(scale=6, elem_id="logs_col"):
                         status = gr.Textbox(value="Waiting for output...", label="Log", lines=30, max_lines=40, interactive=False, elem_id="logs_panel")
@@ -112,138 +292,136 @@ def build_interface():
                     download_files = gr.File(label="Downloads (JPEG/PDF/TikZ)", file_count="multiple", elem_id="downloads")
 
                 def _ensure_code(preset_choice, current_code):
-                    return PRESETS[preset_choice] if preset_choice and PRESETS.get(preset_choice) else current_code
+                    # Empty presets ("None") keep whatever is in the editor
+                    return PRESETS.get(preset_choice) or current_code
 
-                def generate(preset_choice, code_text, provider_choice):
+                async def generate(preset_choice, code_text, provider_choice, request: gr.Request):
                     print(f"[DEBUG] generate function called with preset: {preset_choice}, code length: {len(code_text) if code_text else 0}, provider: {provider_choice}")
+                    if provider_choice not in LLM_OPTIONS_SET:
+                        yield (
+                            gr.update(),
+                            gr.update(),
+                            None,
+                            gr.update(value=f"Error: unknown LLM provider '{provider_choice}'", visible=True),
+                            gr.update(),
+                            gr.update()
+                        )
+                        return
                     # Show Stop, hide Generate when starting
                     yield (
                         gr.update(),                 # latest_tikz
                         gr.update(),                 # pdf_viewer
                         None,                        # download_files
                         gr.update(value="Starting generation...", visible=True),  # status (plain text)
-                        True,                        # loading_state
-                        None,                        # result_state
                         gr.update(visible=False, interactive=False),   # generate_btn
                         gr.update(visible=True, value="Stop", interactive=True)  # stop_btn
                     )
 
-                    # Streaming generator for Gradio
-                    log_accum = []
+                    stop_event = threading.Event()
+                    session = getattr(request, "session_hash", None)
+                    if session:
+                        _RUN_STOPS[session] = stop_event
                     try:
-                        # Relay logs
-                        for evt in render_graph_stream(code_text, provider_choice, want_jpeg=True):
-                            if isinstance(evt, dict) and evt.get("type") == "log":
-                                log_accum.append(evt.get("text", ""))
-                                logs_md = "\n\n".join(log_accum)
-                                yield (
-                                    gr.update(),
-                                    gr.update(),
-                                    None,
-                                    gr.update(value=logs_md, visible=True),
-                                    True,
-                                    "\n\n".join(log_accum),
-                                    gr.update(),  # no change to generate_btn
-                                    gr.update()   # no change to stop_btn
-                                )
-                            elif isinstance(evt, dict) and evt.get("type") == "tikz":
-                                tikz_text = evt.get("tikz", "") or "% (empty)"
-                                yield (
-                                    gr.update(value=tikz_text),
-                                    gr.update(),
-                                    None,
-                                    gr.update(),
-                                    True,
-                                    None,
-                                    gr.update(),  # no change to generate_btn
-                                    gr.update()   # no change to stop_btn
-                                )
-                            elif isinstance(evt, dict) and evt.get("type") == "final":
-                                outputs = evt.get("outputs", {}) or {}
-                                paths = save_outputs(outputs)
-                                downloads = [p for k, p in paths.items() if k in ("jpeg", "pdf", "tex")]
-                                status_text = "Generation Complete\n"
-                                if "pdf" not in outputs:
-                                    status_text += " — PDF compilation unavailable (install tectonic or pdflatex)."
-                                # Build preview
-                                if paths.get("jpeg") and os.path.exists(paths["jpeg"]):
-                                    try:
-                                        with open(paths["jpeg"], "rb") as f:
-                                            b64 = base64.b64encode(f.read()).decode()
-                                        html_preview = (
-                                            '<div style="text-align:center;">'
-                                            f'<img src="data:image/jpeg;base64,{b64}" '
-                                            'style="max-width:90%;height:auto;border:1px solid #ccc;display:inline-block;" '
-                                            'alt="Diagram preview" />'
-                                            '</div>'
-                                        )
-                                    except Exception:
-                                        html_preview = "<p>Failed to load JPEG preview.</p>"
-                                elif paths.get("pdf") and os.path.exists(paths["pdf"]):
-                                    try:
-                                        with open(paths["pdf"], "rb") as f:
-                                            b64 = base64.b64encode(f.read()).decode()
-                                        html_preview = f'<iframe src="data:application/pdf;base64,{b64}" style="width:100%;height:600px;" frameborder="0"></iframe>'
-                                    except Exception:
-                                        html_preview = "<p>Failed to load PDF preview.</p>"
-                                else:
-                                    if paths.get("tex") and os.path.exists(paths["tex"]):
-                                        try:
-                                            with open(paths["tex"], "r", encoding="utf-8", errors="ignore") as f:
-                                                tikz_snippet = f.read()[:2000]
-                                            html_preview = (
-                                                "<p>No PDF generated. Showing first part of TikZ source:</p><pre style='white-space:pre-wrap;font-size:12px;border:1px solid #ccc;padding:8px;max-height:600px;overflow:auto;'>" +
-                                                gr.utils.sanitize_html(tikz_snippet) +
-                                                "</pre>"
-                                            )
-                                        except Exception:
-                                            html_preview = "<p>No PDF generated.</p>"
-                                    else:
-                                        html_preview = "<p>No PDF generated.</p>"
-
-                                # Final UI update: reset buttons to Generate
-                                log_accum.append(status_text)
-                                logs_md = "\n\n".join(log_accum)
-                                yield (
-                                    gr.update(),
-                                    html_preview,
-                                    downloads,
-                                    gr.update(value=logs_md, visible=True),
-                                    False,
-                                    logs_md,
-                                    gr.update(visible=True, value="Generate", interactive=True),
-                                    gr.update(visible=False, value="Stop", interactive=True)
-                                )
-                                return
-                    except Exception as e:
-                        print(f"[ERROR] Generation failed: {e}")
-                        log_accum.append(f"Error: {str(e)}")
-                        logs_md = "\n\n".join(log_accum)
+                        started = time.perf_counter()
+
+                        # Serve repeated (code, provider) requests from the render cache
+                        key = cache_key(code_text, provider_choice)
+                        cached_outputs = get_cached_outputs(key)
+                        if cached_outputs is not None:
+                            events = _cached_events(cached_outputs)
+                        else:
+                            events = arender_graph_stream(code_text, provider_choice, want_jpeg=True, stop_event=stop_event)
+
+                        # Streaming generator for Gradio; new log lines are appended to the
+                        # text instead of re-joining every line on each update
+                        logs_md = ""
+                        log_tail = deque(maxlen=LOG_MAX_ENTRIES)
+
+                        def _append_log(*texts):
+                            nonlocal logs_md
+                            overflow = len(log_tail) + len(texts) > LOG_MAX_ENTRIES
+                            log_tail.extend(texts)
+                            if overflow:
+                                # Oldest lines fell out of the window; rebuild from what is left
+                                logs_md = "\n\n".join(log_tail)
+                            else:
+                                chunk = "\n\n".join(texts)
+                                logs_md = f"{logs_md}\n\n{chunk}" if logs_md else chunk
+                        try:
+                            # Relay logs
+                            async for evt in _batch_logs(events):
+                                if isinstance(evt, dict) and evt.get("type") == "logs":
+                                    _append_log(*evt["texts"])
+                                    yield (
+                                        gr.update(),
+                                        gr.update(),
+                                        None,
+                                        gr.update(value=logs_md, visible=True),
+                                        gr.update(),  # no change to generate_btn
+                                        gr.update()   # no change to stop_btn
+                                    )
+                                elif isinstance(evt, dict) and evt.get("type") == "tikz":
+                                    tikz_text = evt.get("tikz", "") or "% (empty)"
+                                    yield (
+                                        gr.update(value=tikz_text),
+                                        gr.update(),
+                                        None,
+                                        gr.update(),
+                                        gr.update(),  # no change to generate_btn
+                                        gr.update()   # no change to stop_btn
+                                    )
+                                elif isinstance(evt, dict) and evt.get("type") == "final":
+                                    outputs = evt.get("outputs", {}) or {}
+                                    if cached_outputs is None:
+                                        store_outputs(key, outputs)
+                                    paths = save_outputs(outputs)
+                                    downloads = [p for k, p in paths.items() if k in ("jpeg", "pdf", "tex")]
+                                    elapsed = time.perf_counter() - started
+                                    if VERBOSE_LOGS:
+                                        print(f"[METRICS] generate provider={provider_choice} cached={cached_outputs is not None} elapsed_s={elapsed:.2f}")
+                                    status_text = f"Generation Complete ({elapsed:.1f}s)\n"
+                                    if "pdf" not in outputs:
+                                        status_text += " — PDF compilation unavailable (install tectonic or pdflatex)."
+                                    html_preview = build_preview_html(paths, outputs)
+
+                                    # Final UI update: reset buttons to Generate
+                                    _append_log(status_text)
+                                    yield (
+                                        gr.update(),
+                                        html_preview,
+                                        downloads,
+                                        gr.update(value=logs_md, visible=True),
+                                        gr.update(visible=True, value="Generate", interactive=True),
+                                        gr.update(visible=False, value="Stop", interactive=True)
+                                    )
+                                    return
+                        except Exception as e:
+                            print(f"[ERROR] Generation failed: {e}")
+                            _append_log(f"Error: {str(e)}")
+                            yield (
+                                gr.update(),
+                                gr.update(),
+                                None,
+                                gr.update(value=logs_md, visible=True),
+                                gr.update(visible=True, value="Generate", interactive=True),
+                                gr.update(visible=False, value="Stop", interactive=True)
+                            )
+                            return
+
+                        # Fallback if no final event received
+                        _append_log("Generation completed without final output")
                         yield (
                             gr.update(),
                             gr.update(),
                             None,
                             gr.update(value=logs_md, visible=True),
-                            False,
-                            logs_md,
                             gr.update(visible=True, value="Generate", interactive=True),
                             gr.update(visible=False, value="Stop", interactive=True)
                         )
-                        return
-
-                    # Fallback if no final event received
-                    log_accum.append("Generation completed without final output")
-                    logs_md = "\n\n".join(log_accum)
-                    yield (
-                        gr.update(),
-                        gr.update(),
-                        None,
-                        gr.update(value=logs_md, visible=True),
-                        False,
-                        logs_md,
-                        gr.update(visible=True, value="Generate", interactive=True),
-                        gr.update(visible=False, value="Stop", interactive=True)
-                    )
+                    finally:
+                        stop_event.set()
+                        if session and _RUN_STOPS.get(session) is stop_event:
+                            del _RUN_STOPS[session]
 
                 # When preset changes, update code
                 preset.change(_ensure_code, [preset, code], [code])
@@ -252,14 +430,17 @@ def build_interface():
                 generate_btn.click(
                     generate,
                     [preset, code, provider],
-                    [latest_tikz, pdf_viewer, download_files, status, loading_state, result_state, generate_btn, stop_btn],
-                    queue=True
+                    [latest_tikz, pdf_viewer, download_files, status, generate_btn, stop_btn],
+                    queue=True,
+                    concurrency_limit=8,
+                    show_progress="minimal"
                 )
 
                 # Stop button handler
-                def stop_generation():
-                    from llm.workflow import stop_workflow
-                    stop_workflow()
+                def stop_generation(request: gr.Request):
+                    stop_event = _RUN_STOPS.get(getattr(request, "session_hash", None))
+                    if stop_event is not None:
+                        stop_event.set()
                     return (
                         gr.update(value="Stopping workflow...", visible=True),
                         gr.update(visible=False, interactive=False),
@@ -290,38 +471,40 @@ def build_interface():
                     rag_response = gr.Markdown(visible=False)
                     rag_btn = gr.Button("Test Query", variant="secondary")
 
-                from vector_db.index import is_vector_db_ready, get_vector_db_error
-
                 def check_admin_password(pw):
-                    if pw == os.getenv("ADMIN_PASSWORD"):
+                    if _admin_password_ok(pw):
                         return gr.update(visible=False), gr.update(visible=False), True, gr.update(visible=True)
                     else:
                         return gr.update(visible=True, value="Invalid password."), gr.update(visible=True), False, gr.update(visible=False)
 
                 def upload_documents(desc, tikz):
-                    if not is_vector_db_ready():
-                        error = get_vector_db_error()
+                    vdb = _vdb()
+                    if not vdb.is_vector_db_ready():
+                        error = vdb.get_vector_db_error()
                         if error:
                             return gr.update(value=f"Vector DB error: {error}", visible=True)
                         return gr.update(value="Connecting to vector database... Please wait.", visible=True)
                     if not desc.strip() and not tikz.strip():
                         return gr.update(value="No description or TikZ code provided.", visible=True)
                     try:
-                        import json
+                        import orjson
                         doc_obj = {"description": desc.strip(), "tikz": tikz.strip()}
-                        doc_json = json.dumps(doc_obj, ensure_ascii=False)
-                        count = add_documents_to_vector_db([doc_json])
+                        # orjson emits UTF-8 without escaping, matching ensure_ascii=False
+                        doc_json = orjson.dumps(doc_obj).decode("utf-8")
+                        count = vdb.add_documents_to_vector_db([doc_json])
+                        if count == 0:
+                            return gr.update(value="Document already in the database; skipped.", visible=True)
                         return gr.update(value=f"✅ Successfully added {count} document to the database.", visible=True)
                     except Exception as e:
                         return gr.update(value=f"Error adding documents: {str(e)}", visible=True)
 
-                def test_rag_query(query):
+                async def test_rag_query(query):
                     if not query.strip():
                         return gr.update(value="No query provided.", visible=True)
                     try:
-                        from vector_db.rag import perform_rag
+                        from vector_db.rag import aperform_rag
                         print(f"[DEBUG] RAG query initiated: {query}")  # Log the query
-                        response = perform_rag(query)
+                        response = await aperform_rag(query)
                         print(f"[DEBUG] RAG query response: {response}")  # Log the response
                         return gr.update(value=f"**RAG Response:**\n\n```text\n{response}\n```", visible=True), gr.update(visible=False)
                     except Exception as e:
@@ -335,43 +518,21 @@ def build_interface():
                     [password_status, admin_password, admin_authenticated, admin_panel],
                 )
 
-                upload_btn.click(upload_documents, [doc_desc, doc_tikz], [upload_status])
+                # Embedding uploads are CPU-heavy; keep them from crowding out generations
+                upload_btn.click(upload_documents, [doc_desc, doc_tikz], [upload_status], concurrency_limit=2)
                 rag_btn.click(test_rag_query, [rag_query], [rag_response])
 
-        gr.Markdown("""
-        ## Citation
-        If you use ArchGen in your research or teaching, please cite:
-
-        ```
-        @software{jiang_archgen_2025,
-          author    = {Zhiheng Jiang},
-          title     = {ArchGen: Automated Neural Network Architecture Diagram Generation},
-          year      = {2025},
-          url       = {https://github.com/jzh001/ArchGen},
-          license   = {Apache-2.0},
-          note      = {Version: latest}
-        }
-        ```
-
-        ---
-        ## References
-        - [NNTikZ - TikZ Diagrams for Deep Learning and Neural Networks](https://github.com/fraserlove/nntikz)  \
-            Fraser Love, 2024. GitHub repository.  \
-            `@misc{love2024nntikz, author = {Fraser Love}, title = {NNTikZ - TikZ Diagrams for Deep Learning and Neural Networks}, year = 2024, url = {https://github.com/fraserlove/nntikz}, note = {GitHub repository} }`
-        - [Collection of LaTeX resources and examples](https://github.com/davidstutz/latex-resources)  \
-            David Stutz, 2022. GitHub repository.  \
-            `@misc{Stutz2022, author = {David Stutz}, title = {Collection of LaTeX resources and examples}, publisher = {GitHub}, journal = {GitHub repository}, howpublished = {\\url{https://github.com/davidstutz/latex-resources}}, note = {Accessed on MM.DD.YYYY}}`
-        - [tikz.net](https://tikz.net)  \
-            A collection of TikZ examples and resources.
-        """)
-
-        # Reduce polling frequency to lower SSE churn (was 0.2s). Must remain inside Blocks context.
-        timer = gr.Timer(2.0)
-        timer.tick(get_db_status, [], [db_status_state])
-
-        # When db status state changes, update visible markdown.
-        db_status_state.change(update_display, inputs=[db_status_state], outputs=[db_status])
+        gr.Markdown(_CITATION_MD)
+
+        # Push the DB status once it settles; every session waits, so no concurrency cap
+        demo.load(_await_db_status, None, [db_status], concurrency_limit=None, show_progress="hidden")
+
+    # Let async handlers from different sessions overlap while they wait on LLM I/O.
+    demo.queue(default_concurrency_limit=8, max_size=64, api_open=False)
 
+    # Opt-in, since it spends LLM calls on every cold start without a persisted cache
+    if os.getenv("ARCHGEN_WARM_PRESETS") == "1":
+        threading.Thread(target=_warm_presets, daemon=True).start()
     return demo
 
 
@@ -0,0 +1,108 @@
+"""Exact-match cache of rendered diagram outputs.
+
+Entries are keyed on the generation inputs (code, provider, workflow settings,
+prompt file versions and the RAG data version). Recent entries are kept in a small
+in-process LRU and mirrored to ``CACHE_DIR`` as one directory of plain files per
+entry (never unpickled), so rendered diagrams survive restarts.
+"""
+from __future__ import annotations
+from typing import Dict, Optional
+from collections import OrderedDict
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+from constants import (
+    RUBRICS_PROMPT_PATH, GENERATOR_PROMPT_PATH, CRITIC_PROMPT_PATH, ITER_BUDGETS, CACHE_DIR,
+    NUM_CANDIDATES, BATCHED_CANDIDATE_CRITIQUE, SPECULATIVE_REVISION,
+)
+
+
+MAX_MEMORY_ENTRIES = 64
+# Entries live under CACHE_DIR/renders/<key>/, one file per output
+RENDERS_DIR = os.path.join(CACHE_DIR, "renders")
+_FILES = {"tex": "main.tex", "pdf": "main.pdf", "jpeg": "main.jpg"}
+
+_lock = threading.Lock()
+_memory: "OrderedDict[str, Dict[str, bytes]]" = OrderedDict()
+
+def _prompts_version() -> int:
+    """Latest mtime of the prompt files, so editing a prompt invalidates old entries."""
+    version = 0
+    for path in (RUBRICS_PROMPT_PATH, GENERATOR_PROMPT_PATH, CRITIC_PROMPT_PATH):
+        try:
+            version = max(version, os.stat(path).st_mtime_ns)
+        except OSError:
+            pass
+    return version
+
+def _rag_version() -> str:
+    """Embedding backend and, once the vector DB is loaded, its ingest generation; a
+    new upload changes what the agents retrieve."""
+    vindex = sys.modules.get("vector_db.index")
+    generation = getattr(vindex, "INGEST_GENERATION", 0) if vindex is not None else 0
+    return f"{os.environ.get('ARCHGEN_ONNX_EMBED_DIR', '')}:{generation}"
+
+def cache_key(code_text: str, provider_choice: str) -> str:
+    """Key for a render; ``provider_choice`` names the model."""
+    settings = [
+        str(sorted(ITER_BUDGETS.items())), str(NUM_CANDIDATES), str(BATCHED_CANDIDATE_CRITIQUE),
+        str(SPECULATIVE_REVISION), str(_prompts_version()), _rag_version(),
+    ]
+    payload = "\0".join([code_text or "", provider_choice or ""] + settings)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _remember(key: str, outputs: Dict[str, bytes]) -> None:
+    with _lock:
+        _memory[key] = outputs
+        _memory.move_to_end(key)
+        while len(_memory) > MAX_MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+
+def get_cached_outputs(key: str) -> Optional[Dict[str, bytes]]:
+    """Return cached outputs for ``key`` (memory first, then disk) or None."""
+    with _lock:
+        outputs = _memory.get(key)
+        if outputs is not None:
+            _memory.move_to_end(key)
+            return outputs
+    entry = os.path.join(RENDERS_DIR, key)
+    outputs = {}
+    for fmt, name in _FILES.items():
+        try:
+            with open(os.path.join(entry, name), "rb") as f:
+                outputs[fmt] = f.read()
+        except OSError:
+            pass
+    if not (outputs.get("pdf") or outputs.get("jpeg")):
+        return None
+    _remember(key, outputs)
+    return outputs
+
+def store_outputs(key: str, outputs: Dict[str, bytes]) -> None:
+    """Cache outputs of a successful render. Runs without a compiled artefact are skipped."""
+    if not (outputs.get("pdf") or outputs.get("jpeg")):
+        return
+    _remember(key, outputs)
+    try:
+        os.makedirs(RENDERS_DIR, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=f".{key}.", dir=RENDERS_DIR)
+        for fmt, name in _FILES.items():
+            if outputs.get(fmt):
+                with open(os.path.join(tmp, name), "wb") as f:
+                    f.write(outputs[fmt])
+        entry = os.path.join(RENDERS_DIR, key)
+        shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.replace(tmp, entry)
+        except OSError:
+            # Another process stored the same key first
+            shutil.rmtree(tmp, ignore_errors=True)
+    except Exception:
+        # Disk persistence is best-effort; the in-memory entry still serves hits
+        pass
+
+__all__ = ["cache_key", "get_cached_outputs", "store_outputs"]
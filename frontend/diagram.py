@@ -5,48 +5,75 @@ return a JPEG raster (first page) if caller requests and conversion tools are pr
 """
 from __future__ import annotations
 
-from typing import Dict, Any, Generator
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, AsyncGenerator, Generator, Optional
 from llm.workflow import run as llm_workflow, run_stream as llm_workflow_stream
 from tikzconvert import tikz_to_formats
 
-def render_graph(input_code, provider_choice, want_jpeg: bool = False) -> Dict[str, bytes]:
-    """Render TikZ -> PDF (+ optional JPEG) and raw TeX.
+# Advances the blocking workflow generators of async streams, one step per task
+_WORKFLOW_POOL = ThreadPoolExecutor(thread_name_prefix="archgen_workflow")
 
-    Returns keys: tex (always), pdf (if compiled), jpeg (if requested & succeeded).
-    """
-    outputs: Dict[str, bytes] = {}
+# Shared pool for the LaTeX compile + rasterize step. The heavy lifting happens in
+# child processes (tectonic/pdflatex, pdftoppm), so threads only wait on them; the
+# pool bounds how many toolchain runs happen at once across sessions.
+_RENDER_POOL = ThreadPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) - 1), thread_name_prefix="archgen_render")
+
+_GENERATION_FAILED = "% TikZ generation failed"
+
+def _generate_tikz(input_code, provider_choice) -> str:
     try:
-        tikz_doc = llm_workflow(input_code=input_code, provider_choice=provider_choice)
+        return llm_workflow(input_code=input_code, provider_choice=provider_choice)
     except Exception:
-        tikz_doc = "% TikZ generation failed"
+        return _GENERATION_FAILED
+
+def _compile_outputs(tikz_doc: str, want_jpeg: bool) -> Dict[str, bytes]:
+    """Convert TikZ to requested formats (best-effort).
+
+    Returns keys: tex (always), pdf (if compiled), jpeg (if requested & succeeded).
+    """
+    stripped = (tikz_doc or "").strip()
+    if not stripped or stripped.startswith(_GENERATION_FAILED):
+        # Nothing worth compiling; don't spawn a LaTeX run for it
+        return {"tex": stripped.encode("utf-8") if stripped else b"% empty"}
     try:
         fmts = ["tikz", "pdf"]
         if want_jpeg:
             fmts.append("jpeg")
-        tikz_formats = tikz_to_formats(tikz_doc, formats=tuple(fmts))
-    except Exception:
-        tikz_formats = {"tikz": tikz_doc.encode("utf-8")}
-    if "tikz" in tikz_formats:
-        outputs["tex"] = tikz_formats["tikz"]
-    if "pdf" in tikz_formats:
-        outputs["pdf"] = tikz_formats["pdf"]
-    if want_jpeg and "jpeg" in tikz_formats:
-        outputs["jpeg"] = tikz_formats["jpeg"]
+        conv = tikz_to_formats(tikz_doc, formats=tuple(fmts))
+    except Exception as e:
+        conv = {"tikz": (tikz_doc or f"% error: {e}").encode("utf-8", errors="ignore")}
+    return _select_outputs(conv, want_jpeg)
+
+def _select_outputs(conv: Dict[str, bytes], want_jpeg: bool) -> Dict[str, bytes]:
+    outputs: Dict[str, bytes] = {}
+    if "tikz" in conv:
+        outputs["tex"] = conv["tikz"]
+    if "pdf" in conv:
+        outputs["pdf"] = conv["pdf"]
+    if want_jpeg and "jpeg" in conv:
+        outputs["jpeg"] = conv["jpeg"]
     return outputs
 
-def render_graph_stream(input_code, provider_choice, want_jpeg: bool = True) -> Generator[Dict[str, Any], None, None]:
-    """Yield step-wise status logs and tikz updates, and finally compiled outputs.
+def _final_outputs(evt: Dict[str, Any], want_jpeg: bool) -> Dict[str, bytes]:
+    """Outputs for a final relay event, compiling only if the workflow had not already."""
+    compiled = evt.get("compiled")
+    if compiled and (compiled.get("pdf") or compiled.get("jpeg")):
+        return _select_outputs(compiled, want_jpeg)
+    return _compile_outputs(evt["tikz"], want_jpeg)
 
-    Yields dict events for the UI:
-    - {"type": "log", "text": str}
-    - {"type": "tikz", "tikz": str, "stage": "generated"|"compiled"}
-    - Final: {"type": "final", "outputs": {tex/pdf/jpeg bytes present}}
+def _relay_workflow(input_code, provider_choice, stop_event: Optional[threading.Event] = None) -> Generator[Dict[str, Any], None, None]:
+    """Relay UI-facing workflow events; setting ``stop_event`` ends the run early.
+
+    The last event is {"type": "final", "tikz": str, "compiled": dict|None}, where
+    "compiled" holds the workflow's own tikz_to_formats result for that TikZ, if any.
     """
-    print(f"[DEBUG] render_graph_stream called with input_code length: {len(input_code) if input_code else 0}, provider_choice: {provider_choice}")
-    
     last_tikz = ""
+    compiled_tikz, compiled = None, None
     # Relay backend events directly and capture latest tikz
-    for evt in llm_workflow_stream(input_code=input_code, provider_choice=provider_choice):
+    for evt in llm_workflow_stream(input_code=input_code, provider_choice=provider_choice, stop_event=stop_event):
         if not isinstance(evt, dict):
             continue
         etype = evt.get("type")
@@ -62,29 +89,90 @@ def render_graph_stream(input_code, provider_choice, want_jpeg: bool = True) ->
             out = {"type": "tikz", "tikz": last_tikz}
             if "stage" in evt:
                 out["stage"] = evt["stage"]
+            if evt.get("outputs"):
+                compiled_tikz, compiled = last_tikz, evt["outputs"]
             yield out
         elif etype == "final":
             last_tikz = evt.get("tikz", last_tikz)
         else:
             # Unknown; ignore
             pass
+    yield {"type": "final", "tikz": last_tikz, "compiled": compiled if compiled_tikz == last_tikz else None}
 
-    # Convert TikZ to requested formats (best-effort)
-    try:
-        fmts = ["tikz", "pdf"]
-        if want_jpeg:
-            fmts.append("jpeg")
-        conv = tikz_to_formats(last_tikz, formats=tuple(fmts)) if last_tikz else {"tikz": b"% empty"}
-    except Exception as e:
-        conv = {"tikz": (last_tikz or f"% error: {e}").encode("utf-8", errors="ignore")}
-    outputs: Dict[str, bytes] = {}
-    if "tikz" in conv:
-        outputs["tex"] = conv["tikz"]
-    if "pdf" in conv:
-        outputs["pdf"] = conv["pdf"]
-    if want_jpeg and "jpeg" in conv:
-        outputs["jpeg"] = conv["jpeg"]
+def render_graph(input_code, provider_choice, want_jpeg: bool = False) -> Dict[str, bytes]:
+    """Render TikZ -> PDF (+ optional JPEG) and raw TeX.
+
+    Returns keys: tex (always), pdf (if compiled), jpeg (if requested & succeeded).
+    """
+    return _compile_outputs(_generate_tikz(input_code, provider_choice), want_jpeg)
+
+def render_graph_stream(input_code, provider_choice, want_jpeg: bool = True, stop_event: Optional[threading.Event] = None) -> Generator[Dict[str, Any], None, None]:
+    """Yield step-wise status logs and tikz updates, and finally compiled outputs.
 
-    yield {"type": "final", "outputs": outputs}
+    Yields dict events for the UI:
+    - {"type": "log", "text": str}
+    - {"type": "tikz", "tikz": str, "stage": "generated"|"compiled"}
+    - Final: {"type": "final", "outputs": {tex/pdf/jpeg bytes present}}
+
+    Setting ``stop_event`` ends the workflow early with its latest TikZ.
+    """
+    print(f"[DEBUG] render_graph_stream called with input_code length: {len(input_code) if input_code else 0}, provider_choice: {provider_choice}")
+
+    for evt in _relay_workflow(input_code, provider_choice, stop_event):
+        if evt["type"] == "final":
+            yield {"type": "final", "outputs": _final_outputs(evt, want_jpeg)}
+        else:
+            yield evt
+
+async def arender_graph(input_code, provider_choice, want_jpeg: bool = False) -> Dict[str, bytes]:
+    """Async variant of :func:`render_graph`.
+
+    The LLM workflow runs on a worker thread and the LaTeX/raster step on the shared
+    render pool, so the event loop stays free for other sessions.
+    """
+    tikz_doc = await asyncio.to_thread(_generate_tikz, input_code, provider_choice)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_RENDER_POOL, _compile_outputs, tikz_doc, want_jpeg)
+
+async def arender_graph_stream(input_code, provider_choice, want_jpeg: bool = True, stop_event: Optional[threading.Event] = None) -> AsyncGenerator[Dict[str, Any], None]:
+    """Async variant of :func:`render_graph_stream` yielding the same events.
+
+    Each step of the blocking workflow is advanced on a worker thread, and any final
+    compile the workflow did not already do runs on the shared render pool, so waiting
+    on LLM round-trips or LaTeX never stalls the Gradio event loop. If the stream is
+    cancelled or closed early, the run is stopped through ``stop_event``.
+    """
+    loop = asyncio.get_running_loop()
+    stop_event = stop_event or threading.Event()
+    stream = _relay_workflow(input_code, provider_choice, stop_event)
+    done = object()
+    step = None
+    try:
+        while True:
+            step = _WORKFLOW_POOL.submit(next, stream, done)
+            evt = await asyncio.wrap_future(step)
+            step = None
+            if evt is done:
+                break
+            if evt["type"] == "final":
+                outputs = await loop.run_in_executor(_RENDER_POOL, _final_outputs, evt, want_jpeg)
+                yield {"type": "final", "outputs": outputs}
+            else:
+                yield evt
+    finally:
+        # Stop spending LLM calls once nobody reads the events (no-op after a normal finish)
+        stop_event.set()
+        if step is not None and not step.done():
+            # Cancelled while a worker is inside next(stream); closing the generator now
+            # would raise "generator already executing", so let that step return first
+            try:
+                await asyncio.wrap_future(step)
+            except asyncio.CancelledError:
+                # Cancelled again while waiting: the worker closes it when the step returns
+                step.add_done_callback(lambda _: stream.close())
+                raise
+            except Exception:
+                pass
+        stream.close()
 
-__all__ = ["render_graph", "render_graph_stream"]
+__all__ = ["render_graph", "render_graph_stream", "arender_graph", "arender_graph_stream"]
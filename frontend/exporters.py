@@ -1,29 +1,85 @@
 """Export helpers for saving rendered diagram bytes to files for download."""
 from __future__ import annotations
 from typing import Dict
+from collections import deque
+import shutil
 import tempfile
+import threading
+import time
 import os
 
 
+# Rendered artefacts live under one root so Gradio can serve them as static files
+OUTPUT_ROOT = os.path.join(tempfile.gettempdir(), "archgen_outputs")
+# Output directories are deleted once they are this old, so a session's preview and
+# download links stay valid for that long however many other sessions save meanwhile.
+# Leftovers from previous processes past this age are removed on the first save
+OUTPUT_MAX_AGE_SECONDS = 3600
+
+_recent_dirs: "deque[tuple[float, str]]" = deque()  # (created at, path), oldest first
+_dirs_lock = threading.Lock()
+_swept = False
+
 EXT_MAP = {
     "pdf": "pdf",
     "tex": "tikz",  # raw tikz/latex content saved with .tikz extension
     "jpeg": "jpeg",
 }
 
+def _write_bytes(path: str, data: bytes) -> None:
+    """Write ``data`` with raw os.write calls, skipping the buffered file object."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+def _sweep_stale_outputs() -> None:
+    """Remove output directories left behind by earlier processes."""
+    cutoff = time.time() - OUTPUT_MAX_AGE_SECONDS
+    try:
+        entries = list(os.scandir(OUTPUT_ROOT))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.name.startswith("archgen_") and entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            pass
+
+def _new_output_dir() -> str:
+    """Create a directory for one generation and evict those past OUTPUT_MAX_AGE_SECONDS."""
+    global _swept
+    os.makedirs(OUTPUT_ROOT, exist_ok=True)
+    base_dir = tempfile.mkdtemp(prefix="archgen_", dir=OUTPUT_ROOT)
+    now = time.monotonic()
+    evicted = []
+    with _dirs_lock:
+        sweep, _swept = not _swept, True
+        while _recent_dirs and now - _recent_dirs[0][0] >= OUTPUT_MAX_AGE_SECONDS:
+            evicted.append(_recent_dirs.popleft()[1])
+        _recent_dirs.append((now, base_dir))
+    if sweep:
+        _sweep_stale_outputs()
+    for old_dir in evicted:
+        shutil.rmtree(old_dir, ignore_errors=True)
+    return base_dir
+
 def save_outputs(outputs: Dict[str, bytes]) -> Dict[str, str]:
     paths: Dict[str, str] = {}
-    base_dir = tempfile.mkdtemp(prefix="archgen_")
+    base_dir = _new_output_dir()
     for key, data in outputs.items():
         ext = EXT_MAP.get(key, key)
         path = os.path.join(base_dir, f"diagram.{ext}")
         try:
-            with open(path, "wb") as f:
-                f.write(data)
+            _write_bytes(path, data)
             paths[key] = path
         except Exception:
             # Skip file on error
             pass
     return paths
 
-__all__ = ["save_outputs"]
+__all__ = ["save_outputs", "OUTPUT_ROOT"]
@@ -8,4 +8,7 @@ PRESETS = {
     "Transformer": """import torch.nn as nn\n\nclass TransformerModel(nn.Module):\n    def __init__(self, input_dim, num_heads, num_layers, hidden_dim, output_dim):\n        super().__init__()\n        self.encoder_layer = nn.TransformerEncoderLayer(d_model=input_dim, nhead=num_heads, dim_feedforward=hidden_dim)\n        self.transformer_encoder = nn.TransformerEncoder(self.encoder_layer, num_layers=num_layers)\n        self.fc = nn.Linear(input_dim, output_dim)\n\n    def forward(self, x):\n        x = self.transformer_encoder(x)\n        return self.fc(x.mean(dim=1))\n""",
 }
 
-__all__ = ["PRESETS"]
+PRESET_KEYS = tuple(PRESETS)
+DEFAULT_PRESET = "SimpleMLP"
+
+__all__ = ["PRESETS", "PRESET_KEYS", "DEFAULT_PRESET"]
@@ -0,0 +1,83 @@
+"""HTML preview for rendered diagram files (JPEG if available, else PDF, else TikZ source)."""
+from __future__ import annotations
+from typing import Dict, Optional
+from contextlib import suppress
+from pathlib import Path
+from urllib.parse import quote
+import base64
+import html
+import os
+
+import gradio as gr
+
+
+# Gradio 5 moved the static file route under /gradio_api
+_FILE_ROUTE = "/gradio_api/file=" if int(gr.__version__.split(".")[0]) >= 5 else "/file="
+
+# Previews are served from disk through Gradio's file route, which keeps them out of
+# the SSE payload and lets the browser cache them. Setting a byte limit here inlines
+# artefacts up to that size as data URIs instead (e.g. behind proxies that block it).
+INLINE_MAX_BYTES = int(os.environ.get("ARCHGEN_PREVIEW_INLINE_MAX_BYTES", "0"))
+
+_IMG_TMPL = (
+    '<div style="text-align:center;">'
+    '<img src="{src}" '
+    'style="max-width:90%;height:auto;border:1px solid #ccc;display:inline-block;" '
+    'alt="Diagram preview" />'
+    '</div>'
+)
+_PDF_TMPL = '<iframe src="{src}" style="width:100%;height:600px;" frameborder="0"></iframe>'
+_TEX_TMPL = (
+    "<p>No PDF generated. Showing first part of TikZ source:</p>"
+    "<pre style='white-space:pre-wrap;font-size:12px;border:1px solid #ccc;padding:8px;max-height:600px;overflow:auto;'>"
+    "{snippet}"
+    "</pre>"
+)
+_NO_PDF_HTML = "<p>No PDF generated.</p>"
+
+def file_url(path: str) -> str:
+    """URL under which Gradio serves a file from the static output root."""
+    return _FILE_ROUTE + quote(path)
+
+def _preview_src(path: str, st: os.stat_result, mime: str, data: Optional[bytes] = None) -> str:
+    if st.st_size <= INLINE_MAX_BYTES:
+        # Prefer the bytes already in memory; the file is only read if they were dropped
+        if data is None:
+            with suppress(OSError):
+                data = Path(path).read_bytes()
+        if data is not None:
+            return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+    return file_url(path)
+
+def _stat(path: Optional[str]) -> Optional[os.stat_result]:
+    if not path:
+        return None
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+def build_preview_html(paths: Dict[str, str], outputs: Optional[Dict[str, bytes]] = None) -> str:
+    """Build the preview HTML for the files written by save_outputs.
+
+    ``outputs`` are the rendered bytes those files were written from; when given,
+    inlined previews are encoded from them and the files are only read as a fallback.
+    """
+    outputs = outputs or {}
+    st = _stat(paths.get("jpeg"))
+    if st is not None:
+        return _IMG_TMPL.format(src=_preview_src(paths["jpeg"], st, "image/jpeg", outputs.get("jpeg")))
+    st = _stat(paths.get("pdf"))
+    if st is not None:
+        return _PDF_TMPL.format(src=_preview_src(paths["pdf"], st, "application/pdf", outputs.get("pdf")))
+    if _stat(paths.get("tex")) is not None:
+        try:
+            with open(paths["tex"], "r", encoding="utf-8", errors="ignore") as f:
+                tikz_snippet = f.read(2000)
+        except Exception:
+            return _NO_PDF_HTML
+        # Plain text inside <pre>: escaping is all that's needed
+        return _TEX_TMPL.format(snippet=html.escape(tikz_snippet, quote=False))
+    return _NO_PDF_HTML
+
+__all__ = ["build_preview_html", "file_url"]
@@ -1,39 +1,173 @@
 from llm.select_llm import get_llm
 import re
-from llm.tools import search_tikz_database
-from constants import MAX_AGENT_ITER
-from typing import List
-import json
+from constants import CACHE_DIR, MAX_AGENT_ITER, MAX_HISTORY_TURNS, LLM_RESPONSE_CACHE_TTL, LLM_RESPONSE_CACHE_SIZE, LLM_IMAGE_MAX_EDGE, LLM_IMAGE_MAX_BYTES, VERBOSE_LOGS
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional
+import copy
+import hashlib
+import io
+import orjson
+import os
+import threading
+import time
 
+try:
+    import pybase64 as base64  # SIMD-accelerated drop-in for the image payloads
+except ImportError:
+    import base64
+
+# Replies keyed on (provider, full conversation, image): identical requests are
+# answered without another LLM round-trip. Entries are mirrored to disk so repeat
+# runs survive restarts.
+RESPONSE_CACHE_DIR = os.path.join(CACHE_DIR, "llm")
+_response_cache: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (stored_at, text)
+_response_cache_lock = threading.Lock()
+_response_cache_stats = {"hits": 0, "misses": 0}
+
+def _load_response(key: str) -> Optional[tuple]:
+    try:
+        with open(os.path.join(RESPONSE_CACHE_DIR, f"{key}.json"), "rb") as f:
+            stored_at, text = orjson.loads(f.read())
+        return float(stored_at), str(text)
+    except Exception:
+        return None
+
+def _cached_response(key: str, ttl: float) -> Optional[str]:
+    with _response_cache_lock:
+        entry = _response_cache.get(key)
+    if entry is None:
+        entry = _load_response(key)
+    with _response_cache_lock:
+        if entry is not None and time.time() - entry[0] < ttl:
+            _response_cache[key] = entry
+            _response_cache.move_to_end(key)
+            _response_cache_stats["hits"] += 1
+            return entry[1]
+        _response_cache.pop(key, None)
+        _response_cache_stats["misses"] += 1
+        return None
+
+def _store_response(key: str, text: str) -> None:
+    entry = (time.time(), text)
+    with _response_cache_lock:
+        _response_cache[key] = entry
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > LLM_RESPONSE_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+    path = os.path.join(RESPONSE_CACHE_DIR, f"{key}.json")
+    try:
+        os.makedirs(RESPONSE_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(entry))
+        os.replace(tmp_path, path)
+    except Exception:
+        # Disk persistence is best-effort; the in-memory entry still serves hits
+        pass
+
+@lru_cache(maxsize=8)  # the same render goes to the critic and to the next generator call
+def _optimize_image_b64(data_b64: str, max_edge: int = LLM_IMAGE_MAX_EDGE, max_bytes: int = LLM_IMAGE_MAX_BYTES, qualities=(85, 75, 65)) -> str:
+    """Downscale a base64 JPEG to ``max_edge`` and re-encode it, stepping the quality
+    down until it fits ``max_bytes``. Returns the input unchanged when it is already
+    small enough or Pillow is unavailable."""
+    try:
+        from PIL import Image
+    except Exception:
+        return data_b64
+    try:
+        raw = base64.b64decode(data_b64)
+        with Image.open(io.BytesIO(raw)) as img:
+            if max(img.size) <= max_edge and len(raw) <= max_bytes:
+                return data_b64
+            img = img.convert("RGB")
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        for quality in qualities:
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=quality, optimize=True)
+            if buf.tell() <= max_bytes:
+                break
+        return base64.b64encode(buf.getvalue()).decode("ascii")
+    except Exception as e:
+        print(f"[ERROR] Image optimization failed, sending original: {e}")
+        return data_b64
+
+def response_cache_stats() -> dict:
+    """Hit/miss counters of the agent response cache."""
+    with _response_cache_lock:
+        return dict(_response_cache_stats, size=len(_response_cache))
 
-class Agent:
-    def __init__(self, instruction_prompt_path: str, provider_choice: str, tools: list = [], **kwargs):
-        self.model = get_llm(provider_choice, tools=tools)
-        self.config = {"configurable": {"thread_id": "thread1"}}
 
-        with open(instruction_prompt_path) as f:
-            template_text = f.read()
+MAX_PARALLEL_TOOL_CALLS = 8
 
-        def safe_format(template, **kwargs):
-            # Convert double braces to single braces first
-            template = template.replace("{{", "{").replace("}}", "}")
-            # Replace single braces only
-            pattern = re.compile(r'(?<!{){(\w+)}(?!})')
+_PLACEHOLDER_RE = re.compile(r'(?<!{){(\w+)}(?!})')
 
-            def replacer(match):
-                key = match.group(1)
-                return str(kwargs.get(key, match.group(0)))
+@lru_cache(maxsize=32)
+def _render_instruction_prompt(path: str, mtime_ns: int, params: tuple) -> str:
+    """Read a prompt template and fill its {placeholders}.
 
-            return pattern.sub(replacer, template)
+    Cached per (path, modification time, parameters): agents are created on every
+    run with the same templates, and editing a prompt file still takes effect.
+    """
+    with open(path) as f:
+        template = f.read()
+    values = dict(params)
+    # Convert double braces to single braces first
+    template = template.replace("{{", "{").replace("}}", "}")
 
-        self.instruction_prompt = safe_format(template_text, **kwargs)
+    def replacer(match):
+        key = match.group(1)
+        return values.get(key, match.group(0))
+
+    # Replace single braces only
+    return _PLACEHOLDER_RE.sub(replacer, template)
+
+# Content part types that carry text; image parts (base64 data URLs) are never
+# concatenated into text or kept in history
+_TEXT_PART_TYPES = frozenset({"text", "input_text"})
+
+class Agent:
+    def __init__(self, instruction_prompt_path: str, provider_choice: str, tools: list = [], cache_ttl: float = LLM_RESPONSE_CACHE_TTL, **kwargs):
+        self.model = get_llm(provider_choice, tools=tools)
+        # Tools bound to the model, by lower-cased name; without any, replies are final
+        self._tool_map = {str(getattr(t, "name", "")).lower(): t for t in tools}
+        self._has_tools = bool(self._tool_map)
+        self.provider_choice = provider_choice
+        self.cache_ttl = cache_ttl
+        # Token usage across all calls made by this agent
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+
+        self.instruction_prompt = _render_instruction_prompt(
+            instruction_prompt_path,
+            os.stat(instruction_prompt_path).st_mtime_ns,
+            tuple(sorted((k, str(v)) for k, v in kwargs.items())),
+        )
         self.kwargs = kwargs
 
+        # Anthropic needs explicit cache_control breakpoints to cache prompt prefixes
+        self.prompt_cache = provider_choice.startswith("anthropic:")
+
+        system_block = {"type": "text", "text": self.instruction_prompt}
+        if self.prompt_cache:
+            # The instruction prompt is the same on every turn; let Anthropic serve it
+            # from its prompt cache. Dynamic content always comes after this block.
+            system_block["cache_control"] = {"type": "ephemeral"}
+
         # Keep messages as simple role/content dicts
         self.messages: List[dict] = [
-            {"role": "system", "content": [{"type": "text", "text": self.instruction_prompt}]}
+            {"role": "system", "content": [system_block]}
         ]
 
+    def fork(self):
+        """Copy sharing this agent's model and prompt, with its own history."""
+        clone = copy.copy(self)
+        clone.messages = list(self.messages)
+        return clone
+
     @staticmethod
     def _extract_text(content):
         """Safely extract text from LangChain content (list or str)."""
@@ -42,7 +176,7 @@ class Agent:
         if isinstance(content, list):
             parts = []
             for p in content:
-                if isinstance(p, dict) and p.get("type") == "text":
+                if isinstance(p, dict) and p.get("type") in _TEXT_PART_TYPES:
                     parts.append(p.get("text", ""))
                 elif isinstance(p, str):
                     parts.append(p)
@@ -52,25 +186,118 @@ class Agent:
             return str(content.get("content", content))
         return str(content)
 
-    def invoke(self, msg, image=None):
+    def _record_usage(self, response):
+        """Accumulate token counts from a model response (LangChain usage_metadata)."""
+        usage = getattr(response, "usage_metadata", None) or {}
+        details = usage.get("input_token_details") or {}
+        self.input_tokens += usage.get("input_tokens") or 0
+        self.output_tokens += usage.get("output_tokens") or 0
+        self.cache_read_tokens += details.get("cache_read") or 0
+        self.cache_write_tokens += details.get("cache_creation") or 0
+
+    def _run_tool_call(self, tool_call) -> dict:
+        """Execute one tool call and return the normalized tool message."""
+        # tool_call is expected to be a dict with keys: name, args, id
+        tool_name = None
+        tool_args = {}
+        tool_id = None
+        if isinstance(tool_call, dict):
+            tool_name = str(tool_call.get("name", "")).lower()
+            tool_args = tool_call.get("args", {}) or {}
+            tool_id = tool_call.get("id")
+        else:
+            # Fallback for unexpected structures
+            try:
+                tool_name = str(getattr(tool_call, "name", "")).lower()
+                tool_args = getattr(tool_call, "args", {}) or {}
+                tool_id = getattr(tool_call, "id", None)
+            except Exception:
+                tool_name = None
+
+        selected_tool = self._tool_map.get(tool_name)
+
+        if selected_tool is None:
+            tool_result_text = f"Error: unknown tool '{tool_name}'"
+        else:
+            # Invoke the tool with its parsed arguments
+            try:
+                if isinstance(tool_args, str):
+                    try:
+                        tool_args = orjson.loads(tool_args)
+                    except Exception:
+                        tool_args = {"query": tool_args}
+                elif not isinstance(tool_args, dict):
+                    tool_args = {"query": str(tool_args)}
+
+                # Minimal arg normalization for our known tool
+                if tool_name == "search_tikz_database":
+                    if "query" not in tool_args and "input" in tool_args:
+                        tool_args["query"] = tool_args.pop("input")
+                raw_tool_output = selected_tool.invoke(tool_args)
+            except Exception as e:
+                raw_tool_output = f"Tool execution error: {e}"
+            tool_result_text = self._extract_text(raw_tool_output)
+
+        # Tool role message for the model
+        # Prefer OpenAI-style plain string content for tool messages
+        tool_msg = {"role": "tool", "content": tool_result_text}
+        if tool_id:
+            tool_msg["tool_call_id"] = tool_id
+        if tool_name:
+            tool_msg["name"] = tool_name
+        return tool_msg
+
+    @staticmethod
+    def _with_cache_breakpoint(message):
+        """Copy of a message whose last content block carries an ephemeral cache_control,
+        or None if it has no text to mark."""
+        content = message.get("content")
+        if isinstance(content, str):
+            blocks = [{"type": "text", "text": content}] if content else []
+        elif isinstance(content, list):
+            blocks = [dict(b) for b in content if isinstance(b, dict)]
+        else:
+            blocks = []
+        if not blocks or blocks[-1].get("type") != "text" or not blocks[-1].get("text"):
+            return None
+        blocks[-1]["cache_control"] = {"type": "ephemeral"}
+        return {**message, "content": blocks}
+
+    def invoke(self, msg, image=None, images=None):
+        """Send ``msg`` with an optional base64 JPEG ``image`` (or several, in order,
+        as ``images``) and return the reply text."""
         # Build a single multimodal user message using LangChain message parts.
         content_parts = [{"type": "text", "text": msg}]
-        if image:
+        for img in ([image] if image else []) + list(images or []):
+            img = _optimize_image_b64(img)
             # Prefer OpenAI-style image_url with data URL, which LangChain adapters normalize
-            data_url = f"data:image/jpeg;base64,{image}"
+            data_url = f"data:image/jpeg;base64,{img}"
             content_parts.append({"type": "image_url", "image_url": {"url": data_url}})
 
         input_message = {"role": "user", "content": content_parts}
 
+        # Copy the existing conversation state
+        messages_for_model: List[dict] = list(self.messages) + [input_message]
+        cache_key = None
+        if self.cache_ttl:
+            payload = orjson.dumps([self.provider_choice, messages_for_model], option=orjson.OPT_SORT_KEYS, default=str)
+            cache_key = hashlib.blake2b(payload, digest_size=32).hexdigest()
+            cached = _cached_response(cache_key, self.cache_ttl)
+            if cached is not None:
+                if VERBOSE_LOGS:
+                    print(f"[DEBUG] Agent response cache hit ({response_cache_stats()})")
+                self._remember_turn(input_message, cached)
+                return cached
+
         try:
-            # Copy the existing conversation state
-            messages_for_model: List[dict] = list(self.messages) + [input_message]
             iterations = 0
             final_ai_message = None
+            breakpoint_at = None  # (index, unmarked message) of the rolling cache breakpoint
 
             while iterations < MAX_AGENT_ITER:
-                response = self.model.invoke(messages_for_model, config=self.config)
-                tool_calls = getattr(response, "tool_calls", None) or []
+                response = self.model.invoke(messages_for_model)
+                self._record_usage(response)
+                tool_calls = (getattr(response, "tool_calls", None) or []) if self._has_tools else []
 
                 if not tool_calls:
                     # Model returned a regular assistant message
@@ -90,58 +317,25 @@ class Agent:
                     coerced["tool_calls"] = tool_calls
                 messages_for_model.append(coerced)
 
-                # Execute tools and append normalized tool messages
-                for tool_call in tool_calls:
-                    # tool_call is expected to be a dict with keys: name, args, id
-                    tool_name = None
-                    tool_args = {}
-                    tool_id = None
-                    if isinstance(tool_call, dict):
-                        tool_name = str(tool_call.get("name", "")).lower()
-                        tool_args = tool_call.get("args", {}) or {}
-                        tool_id = tool_call.get("id")
-                    else:
-                        # Fallback for unexpected structures
-                        try:
-                            tool_name = str(getattr(tool_call, "name", "")).lower()
-                            tool_args = getattr(tool_call, "args", {}) or {}
-                            tool_id = getattr(tool_call, "id", None)
-                        except Exception:
-                            tool_name = None
-
-                    tool_map = {"search_tikz_database": search_tikz_database}
-                    selected_tool = tool_map.get(tool_name)
-
-                    if selected_tool is None:
-                        tool_result_text = f"Error: unknown tool '{tool_name}'"
-                    else:
-                        # Invoke the tool with its parsed arguments
-                        try:
-                            if isinstance(tool_args, str):
-                                try:
-                                    tool_args = json.loads(tool_args)
-                                except Exception:
-                                    tool_args = {"query": tool_args}
-                            elif not isinstance(tool_args, dict):
-                                tool_args = {"query": str(tool_args)}
-
-                            # Minimal arg normalization for our known tool
-                            if tool_name == "search_tikz_database":
-                                if "query" not in tool_args and "input" in tool_args:
-                                    tool_args["query"] = tool_args.pop("input")
-                            raw_tool_output = selected_tool.invoke(tool_args)
-                        except Exception as e:
-                            raw_tool_output = f"Tool execution error: {e}"
-                        tool_result_text = self._extract_text(raw_tool_output)
-
-                    # Append a tool role message for the model
-                    # Prefer OpenAI-style plain string content for tool messages
-                    tool_msg = {"role": "tool", "content": tool_result_text}
-                    if tool_id:
-                        tool_msg["tool_call_id"] = tool_id
-                    if tool_name:
-                        tool_msg["name"] = tool_name
-                    messages_for_model.append(tool_msg)
+                # Execute tools (independent I/O-bound lookups run concurrently) and
+                # append the normalized tool messages in call order
+                if len(tool_calls) == 1:
+                    messages_for_model.append(self._run_tool_call(tool_calls[0]))
+                else:
+                    with ThreadPoolExecutor(max_workers=min(len(tool_calls), MAX_PARALLEL_TOOL_CALLS)) as pool:
+                        messages_for_model.extend(pool.map(self._run_tool_call, tool_calls))
+
+                if self.prompt_cache:
+                    # Move the rolling breakpoint to the newest tool result so the next
+                    # round reuses everything before it; one at a time keeps us well
+                    # under Anthropic's four-breakpoint limit
+                    if breakpoint_at is not None:
+                        messages_for_model[breakpoint_at[0]] = breakpoint_at[1]
+                        breakpoint_at = None
+                    marked = self._with_cache_breakpoint(messages_for_model[-1])
+                    if marked is not None:
+                        breakpoint_at = (len(messages_for_model) - 1, messages_for_model[-1])
+                        messages_for_model[-1] = marked
 
                 iterations += 1
 
@@ -168,7 +362,28 @@ class Agent:
             print("LLM invocation failed:", e)
             raise e
 
-        # Persist the user and assistant messages in history
-        self.messages.append(input_message)
-        self.messages.append({"role": "assistant", "content": [{"type": "text", "text": ai_msg_content}]})
+        if cache_key is not None and ai_msg_content:
+            _store_response(cache_key, ai_msg_content)
+
+        if VERBOSE_LOGS and self.input_tokens:
+            hit_rate = self.cache_read_tokens / self.input_tokens
+            print(f"[DEBUG] Agent tokens: input={self.input_tokens} output={self.output_tokens} cache_read={self.cache_read_tokens} cache_write={self.cache_write_tokens} cache_hit={hit_rate:.0%}")
+
+        self._remember_turn(input_message, ai_msg_content)
         return ai_msg_content
+
+    def _remember_turn(self, input_message, reply_text):
+        """Persist the user and assistant messages in history.
+
+        Only the text of the user turn is kept: an attached image belongs to the
+        diagram being reviewed now and would otherwise be re-sent on every later call.
+        """
+        text_parts = [p for p in input_message["content"] if isinstance(p, dict) and p.get("type") in _TEXT_PART_TYPES]
+        self.messages.append({"role": "user", "content": text_parts})
+        self.messages.append({"role": "assistant", "content": [{"type": "text", "text": reply_text}]})
+        # Keep the instruction prompt, the first turn (it holds the content to depict and
+        # later messages don't repeat it) and the most recent turns, so input size stays
+        # bounded; whole turns are dropped so user and assistant messages still alternate
+        excess = len(self.messages) - 1 - 2 * max(MAX_HISTORY_TURNS, 2)
+        if excess > 0:
+            del self.messages[3:3 + excess]
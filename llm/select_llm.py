@@ -1,34 +1,85 @@
-from langchain_anthropic import ChatAnthropic
-from langchain_ollama import ChatOllama
-from langchain_google_genai import ChatGoogleGenerativeAI
+from constants import LLM_TIMEOUTS, LLM_DEFAULT_TIMEOUT, LLM_MAX_RETRIES
+from functools import lru_cache
+import os
+import threading
 
-def get_llm(llm_option: str, tools: list = []):
+@lru_cache(maxsize=None)
+def _env(name: str):
+    """Environment lookup resolved once per process (.env is loaded before the first LLM is built)."""
+    return os.getenv(name)
+
+def _api_key_kwargs(field: str, env_var: str) -> dict:
+    key = _env(env_var)
+    return {field: key} if key else {}
 
-    import os
+@lru_cache(maxsize=8)
+def _chat_model(llm_option: str):
+    """Build the provider chat model once per option so its HTTP client and
+    connection pool are reused across agents and requests."""
+    timeout = LLM_TIMEOUTS.get(llm_option, LLM_DEFAULT_TIMEOUT)
+    # Provider SDKs are imported on first use, so only the chosen one is loaded
     if llm_option == "anthropic:claude-4-sonnet":
+        from langchain_anthropic import ChatAnthropic
         llm = ChatAnthropic(
             model="claude-sonnet-4-20250514",
             max_tokens=5000,
             thinking={"type": "disabled"},
+            timeout=timeout,
+            max_retries=LLM_MAX_RETRIES,
+            **_api_key_kwargs("anthropic_api_key", "ANTHROPIC_API_KEY"),
         )
     elif llm_option.startswith("ollama:"):
-        base_url = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+        import httpx  # installed with ollama
+        from langchain_ollama import ChatOllama
+        base_url = _env("OLLAMA_BASE_URL") or "http://localhost:11434"
         model_name = llm_option[len("ollama:"):]
         llm = ChatOllama(
             model=model_name,
             base_url=base_url,
             max_tokens=5000,
             thinking={"type": "disabled"},
+            # ollama's clients are httpx clients; size the keep-alive pool for the
+            # concurrent generator samples and tool rounds that share this model
+            client_kwargs={"timeout": timeout, "limits": httpx.Limits(max_connections=64, max_keepalive_connections=32)},
         )
     elif llm_option.startswith("google-genai:"):
+        from langchain_google_genai import ChatGoogleGenerativeAI
         model_name = llm_option[len("google-genai:"):]
         llm = ChatGoogleGenerativeAI(
             model=model_name,
+            timeout=timeout,
+            max_retries=LLM_MAX_RETRIES,
+            **_api_key_kwargs("google_api_key", "GOOGLE_API_KEY"),
         )
     else:
         raise ValueError(f"Unknown llm_option: {llm_option}")
+    return llm
+
+# Bound runnables keyed on (llm_option, tool names); shared by every Agent using them
+_bound_llms = {}
+_bound_llms_lock = threading.Lock()
+
+def get_llm(llm_option: str, tools: list = []):
+    key = (llm_option, tuple(sorted(str(getattr(t, "name", t)) for t in tools)))
+    with _bound_llms_lock:
+        llm = _bound_llms.get(key)
+    if llm is not None:
+        return llm
+
+    llm = _chat_model(llm_option)
 
     # Bind tools only when provided and ensure we use the returned Runnable
     if tools:
         llm = llm.bind_tools(tools)
-    return llm
+    if llm_option.startswith("ollama:"):
+        # ChatOllama has no built-in retries; back off exponentially with jitter
+        llm = llm.with_retry(stop_after_attempt=LLM_MAX_RETRIES, wait_exponential_jitter=True)
+    with _bound_llms_lock:
+        return _bound_llms.setdefault(key, llm)
+
+def reset_llm_cache():
+    """Drop cached chat models and tool bindings (e.g. after changing credentials)."""
+    with _bound_llms_lock:
+        _bound_llms.clear()
+    _chat_model.cache_clear()
+    _env.cache_clear()
@@ -1,5 +1,12 @@
-from pydantic import BaseModel, Field
 from langchain_core.tools import tool
+from functools import cache
+
+@cache
+def _perform_rag():
+    """vector_db.rag.perform_rag, imported on first use (it pulls in the embedding stack
+    and starts the DB connection) and then reused by every tool call."""
+    from vector_db.rag import perform_rag
+    return perform_rag
 
 @tool
 def search_tikz_database(query: str, top_k: int = 5) -> str:
@@ -11,8 +18,6 @@ def search_tikz_database(query: str, top_k: int = 5) -> str:
 
     Delegates to perform_rag and returns plain text (concatenated retrieved snippets).
     """
-    from vector_db.rag import perform_rag
-
-    result = perform_rag(query, top_k=top_k)
+    result = _perform_rag()(query, top_k=top_k)
     # Ensure we always return a string
     return result if isinstance(result, str) else ""
@@ -1,42 +1,212 @@
-from llm.agent import Agent
-from constants import RUBRICS_PROMPT_PATH, GENERATOR_PROMPT_PATH, CRITIC_PROMPT_PATH, MAX_ITER
+from constants import RUBRICS_PROMPT_PATH, GENERATOR_PROMPT_PATH, CRITIC_PROMPT_PATH, ITER_BUDGETS, NUM_CANDIDATES, SPECULATIVE_REVISION, VERBOSE_LOGS, BATCHED_CANDIDATE_CRITIQUE
 from tikzconvert.compile import tikz_to_formats
-import re, base64, shutil, tempfile, os
-from llm.tools import search_tikz_database
-
-# Global flag to terminate the workflow
-terminate_workflow = False
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional
+import importlib.util, io, re, shutil, os, tempfile, threading
+try:
+    import pybase64 as base64  # SIMD-accelerated drop-in for the image payloads
+except ImportError:
+    import base64
+
+# Runs generator revisions speculatively while the critic reviews (SPECULATIVE_REVISION)
+_SPECULATIVE_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="archgen_spec")
+_COMPILE_FORMATS = ("jpeg", "pdf", "tikz")
+
+def _compile_tikz(tikz_code: str, workdir: Optional[str] = None) -> dict:
+    """tikz_to_formats(tikz_code) with the formats the workflow uses; repeated sources
+    are served by its content-addressed compile cache."""
+    return tikz_to_formats(tikz_code, formats=_COMPILE_FORMATS, workdir=workdir)
+
+_SELF_REVIEW_MSG = (
+    "The attached image is the rendered diagram of your last TikZ code. Check it against the "
+    "rubrics (overlaps, clipped labels, spacing, readability, fidelity to the input) and return "
+    "an improved version.{feedback}\n\n"
+    "Return ONLY a single fenced LaTeX block (```latex ... ```)."
+)
+
+# Detect whether a LaTeX toolchain / rasterizer is available in the runtime.
+# If not present (common when a Spaces runtime doesn't include TeX), we
+# short-circuit the compile->fix loop to avoid infinite retries: return
+# the generator's TikZ source after the first successful generation.
+# PATH does not change while the app runs, so each probe is done once.
+@lru_cache(maxsize=1)
+def _latex_available() -> bool:
+    paths = [shutil.which(x) for x in ("tectonic", "latexmk", "pdflatex")]
+    print("[DEBUG] LaTeX toolchain paths:", paths)
+    return any(paths)
+
+@lru_cache(maxsize=1)
+def _rasterizer_available() -> bool:
+    if importlib.util.find_spec("pypdfium2") is not None:
+        return True
+    return any(shutil.which(x) for x in ("pdftoppm", "pdftocairo", "magick", "convert", "gs"))
+
+@lru_cache(maxsize=1)
+def _pillow_available():
+    try:
+        import PIL.Image as PILImage  # type: ignore
+        return PILImage
+    except Exception:
+        return None
+
+@lru_cache(maxsize=1)
+def _imagesize():
+    try:
+        import imagesize  # type: ignore  # optional; reads only the SOF marker
+        return imagesize
+    except Exception:
+        return None
+
+def _jpeg_size(jpeg_bytes: bytes):
+    """(width, height) read straight from the bytes (imagesize, else PIL which only
+    parses the header); (0, 0) if neither is available or the image can't be read."""
+    imagesize = _imagesize()
+    if imagesize is not None:
+        try:
+            width, height = imagesize.get(io.BytesIO(jpeg_bytes))
+            if width > 0 and height > 0:
+                return width, height
+        except Exception:
+            pass
+    PILImage = _pillow_available()
+    if PILImage is None:
+        return 0, 0
+    try:
+        with PILImage.open(io.BytesIO(jpeg_bytes)) as img:
+            return img.size
+    except Exception as e:
+        print(f"[ERROR] Could not read JPEG size: {e}")
+        return 0, 0
+
+def _extreme_aspect(width: int, height: int) -> bool:
+    return bool(width and height and max(width / height, height / width) > 5)
+
+@lru_cache(maxsize=4)
+def _read_prompt_file(path: str, mtime_ns: int) -> str:
+    """Contents of a prompt file, cached until the file is modified."""
+    with open(path, 'r') as f:
+        return f.read()
+
+@lru_cache(maxsize=8)
+def _jpeg_b64(jpeg_bytes: bytes) -> str:
+    """Base64 of a rendered JPEG; an unchanged diagram is not re-encoded next round."""
+    return base64.b64encode(jpeg_bytes).decode("ascii")
+
+ERROR_CONTEXT_LINES = 10
+
+def _extract_error_excerpt(log: str, context: int = ERROR_CONTEXT_LINES) -> str:
+    """The lines around the first LaTeX error ("! ..." or tectonic's "error: ...");
+    the last lines of the log if no error line is found."""
+    lines = (log or "").splitlines()
+    for i, line in enumerate(lines):
+        if line.startswith("!") or line.startswith("error:"):
+            return "\n".join(lines[max(0, i - context):i + context + 1])
+    return "\n".join(lines[-2 * context:]) or "No detailed error log available."
+
+@lru_cache(maxsize=16)
+def _agent_template(prompt_path: str, prompt_mtime_ns: int, provider_choice: str, rubrics: str, cache_ttl):
+    """Agent that is never invoked itself; runs with the same prompt, rubrics and
+    provider fork it instead of constructing (and rendering the prompt) again."""
+    # Imported here so loading this module (e.g. at app start) doesn't pull in the
+    # LangChain stack before the first generation
+    from llm.agent import Agent
+    from llm.tools import search_tikz_database
+    kwargs = {} if cache_ttl is None else {"cache_ttl": cache_ttl}
+    return Agent(prompt_path, rubrics=rubrics, provider_choice=provider_choice, tools=[search_tikz_database], **kwargs)
+
+def _new_agent(prompt_path: str, provider_choice: str, rubrics: str, cache_ttl=None):
+    """A fresh agent (empty history) for one run."""
+    return _agent_template(prompt_path, os.stat(prompt_path).st_mtime_ns, provider_choice, rubrics, cache_ttl).fork()
+
+def _make_tikz_variants(raw: str):
+    """Return the TikZ content as-is. No escaping/normalization needed with code fences."""
+    return [("as_is", raw)]
+
+def _sample_candidates(agents, msg: str, compile_possible: bool, stop_event: threading.Event):
+    """Invoke several generator agents concurrently and compile each answer.
+
+    Returns (agent, ai_msg, tikz_code, outputs) tuples in agent order; candidates
+    whose LLM call failed are dropped.
+    """
+    def _one(agent):
+        ai_msg = agent.invoke(msg)
+        tikz_code = extract_tikz_code(ai_msg)
+        outputs = {}
+        # A stop during sampling makes the compile pointless
+        if tikz_code and compile_possible and not stop_event.is_set():
+            try:
+                outputs = _compile_tikz(tikz_code)
+            except Exception as e:
+                outputs = {"log": str(e).encode("utf-8", errors="ignore")}
+        return agent, ai_msg, tikz_code, outputs
+
+    results = []
+    with ThreadPoolExecutor(max_workers=len(agents)) as pool:
+        futures = [pool.submit(_one, agent) for agent in agents]
+        for i, future in enumerate(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"[ERROR] Candidate {i + 1} generation failed: {e}")
+    return results
 
-def stop_workflow():
-    """Set the global flag to terminate the workflow."""
-    global terminate_workflow
-    terminate_workflow = True
+_BATCH_APPROVED_RE = re.compile(r"\bAPPROVED_([A-Z])\b")
+_BATCH_BEST_RE = re.compile(r"\bBEST_([A-Z])\b")
 
-def reset_workflow_termination():
-    """Reset the global flag after the workflow ends."""
-    global terminate_workflow
-    terminate_workflow = False
+def _critique_candidates(critic_agent, candidates, input_code: str):
+    """Ask the critic to compare rendered candidates in a single call.
 
-def run_stream(input_code: str, provider_choice: str):
+    ``candidates`` are _sample_candidates tuples that all have a JPEG. Returns
+    (critique, index, approved), or None when the reply names no valid candidate.
+    """
+    labels = [chr(ord("A") + i) for i in range(len(candidates))]
+    sources = "\n".join(f"Candidate {label} TikZ code:\n{c[2]}\n" for label, c in zip(labels, candidates))
+    critic_prompt = (
+        f"{len(candidates)} candidate diagrams for the same input are attached as base64 JPEGs, "
+        f"in order {', '.join(labels)}, with their TikZ sources below.\n"
+        "Pick the best candidate. If it needs no further changes, include a line with exactly: "
+        "APPROVED_<letter>. Otherwise include a line with exactly: BEST_<letter>, followed by a "
+        "brief critique and concrete suggestions in plain text for that candidate only.\n\n"
+        + sources
+        + "Original input code:\n"
+        + f"{input_code}\n"
+    )
+    reply = critic_agent.invoke(critic_prompt, images=[_jpeg_b64(c[3]["jpeg"]) for c in candidates])
+    for pattern, approved in ((_BATCH_APPROVED_RE, True), (_BATCH_BEST_RE, False)):
+        m = pattern.search(reply or "")
+        if m and ord(m.group(1)) - ord("A") < len(candidates):
+            return reply, ord(m.group(1)) - ord("A"), approved
+    return None
+
+def run_stream(input_code: str, provider_choice: str, stop_event: Optional[threading.Event] = None):
     """Stream the generator-critic loop events for the frontend.
 
+    Setting ``stop_event`` (owned by the caller, one per run) ends this run early with
+    the latest TikZ; other runs are unaffected.
+
     Yields dict events:
     - {"type": "log", "text": str} at the end of each major step (generator/compile/critic)
+    - {"type": "tikz", "tikz": str, "stage": "generated"|"compiled"}; compiled events
+      also carry "outputs", the tikz_to_formats result for that source
     - Final yield: {"type": "final", "tikz": str}
     """
+    # One LaTeX working directory per run, so retries reuse the auxiliary files
+    with tempfile.TemporaryDirectory(prefix="archgen_run_") as workdir:
+        yield from _run_stream(input_code, provider_choice, workdir, stop_event or threading.Event())
+
+def _run_stream(input_code: str, provider_choice: str, workdir: str, stop_event: threading.Event):
     print(f"[DEBUG] run_stream called with input_code length: {len(input_code) if input_code else 0}, provider_choice: {provider_choice}")
+
+    terminate_workflow = stop_event.is_set
     
-    # Reset the termination flag at the start of each workflow
-    global terminate_workflow
-    terminate_workflow = False
-    
-    with open(RUBRICS_PROMPT_PATH, 'r') as f:
-        rubrics = f.read()
+    rubrics = _read_prompt_file(RUBRICS_PROMPT_PATH, os.stat(RUBRICS_PROMPT_PATH).st_mtime_ns)
 
     tikz_code = ""
     jpeg_b64 = ""
     iteration = 0
-    max_iter = MAX_ITER  # will be increased whenever we need more attempts
+    # Rounds left per outcome; a round that ends in an exhausted outcome ends the run
+    budgets = dict(ITER_BUDGETS)
 
     # Initial ask to the generator
     msg_to_generator = (
@@ -46,54 +216,20 @@ def run_stream(input_code: str, provider_choice: str):
         "No surrounding prose."
     )
 
-    tools = [search_tikz_database]
-
-    # Hard safety ceiling to avoid truly infinite loops in pathological cases
-    safety_ceiling = MAX_ITER + 25
     print(f"[DEBUG] About to create generator_agent with provider: {provider_choice}")
     
-    generator_agent = Agent(
-        GENERATOR_PROMPT_PATH,
-        rubrics=rubrics,
-        provider_choice=provider_choice,
-        tools=tools,
-    )
+    def _new_generator(cache_ttl=None):
+        return _new_agent(GENERATOR_PROMPT_PATH, provider_choice, rubrics, cache_ttl)
+
+    generator_agent = _new_generator()
     print(f"[DEBUG] Generator agent created successfully")
 
-    critic_agent = Agent(
-        CRITIC_PROMPT_PATH,
-        rubrics=rubrics,
-        provider_choice=provider_choice,
-        tools=tools,
-    )
+    critic_agent = _new_agent(CRITIC_PROMPT_PATH, provider_choice, rubrics)
     print(f"[DEBUG] Critic agent created successfully")
 
     # print("[Generator Prompt] ", generator_agent.messages[0])
     # print("[Critic Prompt] ", critic_agent.messages[0])
 
-    # Detect whether a LaTeX toolchain / rasterizer is available in the runtime.
-    # If not present (common when a Spaces runtime doesn't include TeX), we
-    # short-circuit the compile->fix loop to avoid infinite retries: return
-    # the generator's TikZ source after the first successful generation.
-    def _latex_available() -> bool:
-        paths = [shutil.which(x) for x in ("tectonic", "latexmk", "pdflatex")]
-        print("[DEBUG] LaTeX toolchain paths:", paths)
-        return any(paths)
-
-    def _rasterizer_available() -> bool:
-        return any(shutil.which(x) for x in ("pdftoppm", "pdftocairo", "magick", "convert", "gs"))
-
-    def _pillow_available():
-        try:
-            import PIL.Image as PILImage  # type: ignore
-            return PILImage
-        except Exception:
-            return None
-
-    def _make_tikz_variants(raw: str):
-        """Return the TikZ content as-is. No escaping/normalization needed with code fences."""
-        return [("as_is", raw)]
-
     compile_possible = _latex_available()
     raster_possible = _rasterizer_available()
     print(f"[DEBUG] compile_possible: {compile_possible}, raster_possible: {raster_possible}")
@@ -101,29 +237,90 @@ def run_stream(input_code: str, provider_choice: str):
     if not compile_possible:
         yield {"type": "log", "text": "[workflow] No LaTeX engine detected in PATH. Skipping compile/critic loop; will return TikZ when produced."}
 
-    print(f"[DEBUG] About to enter workflow loop. max_iter: {max_iter}, safety_ceiling: {safety_ceiling}")
-    print(f"[DEBUG] terminate_workflow flag: {terminate_workflow}")
+    # Compile results of TikZ sources already built this run (e.g. sampled candidates)
+    precompiled = {}
+    # Revision drafted while the critic was reviewing, and critique that draft has not seen
+    speculative_reply = None
+    carried_feedback = ""
+    # (critique, approved) for this round's diagram from the batched candidate critique
+    batched_verdict = None
+
+    print(f"[DEBUG] About to enter workflow loop. budgets: {budgets}")
+    print(f"[DEBUG] terminate_workflow flag: {terminate_workflow()}")
     
+    def _spend(reason: str) -> bool:
+        """Charge a round to ``reason``; False once that budget is used up."""
+        budgets[reason] -= 1
+        return budgets[reason] > 0
+
     # Add logging to confirm LLM invocation
-    while iteration < max_iter and iteration < safety_ceiling:
-        if terminate_workflow:
+    while True:
+        if terminate_workflow():
             yield {"type": "log", "text": "[workflow] Termination requested. Using the latest TikZ code."}
             break
 
         iteration += 1
 
         # Log the message being sent to the generator
-        print(f"[DEBUG] Message to generator (iteration {iteration}):\n{msg_to_generator}")
+        if VERBOSE_LOGS:
+            print(f"[DEBUG] Message to generator (iteration {iteration}):\n{msg_to_generator}")
 
         # 1) Ask generator to produce TikZ
-        yield {"type": "log", "text": f"[Generator] Requesting TikZ (iteration {iteration})..."}
-        try:
-            ai_msg = generator_agent.invoke(msg_to_generator, image=jpeg_b64 if jpeg_b64 else None)
-            print(f"[DEBUG] Response from generator (iteration {iteration}):\n{ai_msg}")
-        except Exception as e:
-            print(f"[ERROR] LLM invocation failed (iteration {iteration}): {e}")
-            yield {"type": "log", "text": f"[ERROR] LLM invocation failed: {e}"}
-            break
+        batched_verdict = None
+        if iteration == 1 and NUM_CANDIDATES > 1 and compile_possible:
+            # Sample several first drafts at once and keep one that compiles, so a
+            # failed first compile does not cost a full generator/critic round
+            yield {"type": "log", "text": f"[Generator] Requesting {NUM_CANDIDATES} TikZ candidates in parallel (iteration {iteration})..."}
+            # Extra samples skip the response cache, or they would all replay one answer
+            agents = [generator_agent] + [_new_generator(cache_ttl=0) for _ in range(NUM_CANDIDATES - 1)]
+            candidates = _sample_candidates(agents, msg_to_generator, compile_possible, stop_event)
+            if not candidates:
+                yield {"type": "log", "text": "[ERROR] LLM invocation failed for all candidates."}
+                break
+            for _, _, cand_code, cand_outputs in candidates:
+                if cand_code and cand_outputs:
+                    precompiled[cand_code] = cand_outputs
+            # Prefer a candidate that compiled, then one that passes the aspect-ratio
+            # gate, then one that contains TikZ at all
+            best = min(
+                range(len(candidates)),
+                key=lambda i: (
+                    not (candidates[i][3].get("jpeg") or candidates[i][3].get("pdf")),
+                    bool(candidates[i][3].get("jpeg")) and _extreme_aspect(*_jpeg_size(candidates[i][3]["jpeg"])),
+                    not candidates[i][2],
+                ),
+            )
+            n_compiled = sum(1 for c in candidates if c[3].get("jpeg") or c[3].get("pdf"))
+            rendered = [i for i, c in enumerate(candidates) if c[3].get("jpeg")]
+            if BATCHED_CANDIDATE_CRITIQUE and len(rendered) > 1 and not terminate_workflow():
+                yield {"type": "log", "text": f"[Critic] Comparing {len(rendered)} rendered candidates..."}
+                try:
+                    verdict = _critique_candidates(critic_agent, [candidates[i] for i in rendered], input_code)
+                except Exception as e:
+                    print(f"[ERROR] Batched candidate critique failed: {e}")
+                    verdict = None
+                if verdict is not None:
+                    ai_msg_critic, pick, approved = verdict
+                    best = rendered[pick]
+                    batched_verdict = (ai_msg_critic, approved)
+                else:
+                    # No usable pick: the chosen candidate gets the usual critic round
+                    yield {"type": "log", "text": "[Critic] No candidate picked; reviewing one candidate instead."}
+            generator_agent, ai_msg = candidates[best][0], candidates[best][1]
+            yield {"type": "log", "text": f"[Generator] {n_compiled}/{len(candidates)} candidates compiled; continuing with candidate {best + 1}."}
+        elif speculative_reply is not None:
+            ai_msg, speculative_reply = speculative_reply, None
+            yield {"type": "log", "text": f"[Generator] Using the revision drafted during the critique (iteration {iteration})."}
+        else:
+            yield {"type": "log", "text": f"[Generator] Requesting TikZ (iteration {iteration})..."}
+            try:
+                ai_msg = generator_agent.invoke(msg_to_generator, image=jpeg_b64 if jpeg_b64 else None)
+                if VERBOSE_LOGS:
+                    print(f"[DEBUG] Response from generator (iteration {iteration}):\n{ai_msg}")
+            except Exception as e:
+                print(f"[ERROR] LLM invocation failed (iteration {iteration}): {e}")
+                yield {"type": "log", "text": f"[ERROR] LLM invocation failed: {e}"}
+                break
 
         yield {"type": "log", "text": f"[Generator]\n{ai_msg}"}
         tikz_code = extract_tikz_code(ai_msg)
@@ -132,7 +329,7 @@ def run_stream(input_code: str, provider_choice: str):
             yield {"type": "tikz", "tikz": tikz_code, "stage": "generated"}
 
         # If a stop was requested during or right after generation, exit early with latest TikZ
-        if terminate_workflow:
+        if terminate_workflow():
             yield {"type": "log", "text": "[workflow] Stop requested after generation. Skipping compile and returning latest TikZ."}
             break
 
@@ -164,18 +361,20 @@ def run_stream(input_code: str, provider_choice: str):
                 + ai_msg_critic.strip() +
                 "\n\nReturn ONLY a single fenced LaTeX block (```latex ... ```)."
             )
-            max_iter += 1
+            if not _spend("no_code"):
+                yield {"type": "log", "text": "[workflow] Giving up after repeated responses without a LaTeX block. Returning the latest TikZ."}
+                break
             continue
 
         # 2) Try compiling to JPEG (if possible in this runtime)
         if compile_possible:
             for tag, variant_code in variants:
-                if terminate_workflow:
+                if terminate_workflow():
                     yield {"type": "log", "text": "[workflow] Stop requested before compile. Skipping compile."}
                     break
                 try:
                     yield {"type": "log", "text": f"[Compile] Attempting variant '{tag}'..."}
-                    outputs = tikz_to_formats(variant_code, formats=("jpeg", "pdf", "tikz"))
+                    outputs = precompiled.pop(variant_code, None) or _compile_tikz(variant_code, workdir)
                 except Exception as e:
                     last_log = str(e)
                     outputs = {"log": last_log.encode("utf-8", errors="ignore")}
@@ -186,7 +385,8 @@ def run_stream(input_code: str, provider_choice: str):
                         last_log = outputs["log"].decode("utf-8", errors="replace")
                     except Exception:
                         last_log = str(outputs["log"]) if outputs.get("log") is not None else last_log
-                    print(f"[DEBUG] LaTeX compilation log (variant '{tag}'):\n{last_log}")
+                    if VERBOSE_LOGS:
+                        print(f"[DEBUG] LaTeX compilation log (variant '{tag}'):\n{last_log}")
 
                 if "jpeg" in outputs and outputs.get("jpeg"):
                     chosen_variant = (tag, variant_code)
@@ -201,14 +401,17 @@ def run_stream(input_code: str, provider_choice: str):
 
             if not chosen_variant:
                 compile_error_log = last_log or "No detailed error log available."
-                print(f"[DEBUG] Compilation failed for all variants. Last error log:\n{compile_error_log}")
+                print(f"[DEBUG] Compilation failed for all variants (iteration {iteration}).")
+                if VERBOSE_LOGS:
+                    print(f"[DEBUG] Last error log:\n{compile_error_log}")
 
         # If compilation failed or not possible, go to critic with error log
         if not chosen_variant:
+            error_excerpt = _extract_error_excerpt(compile_error_log or last_log)
             critic_prompt = (
                 "TikZ code failed to compile.\n\n"
                 f"TikZ source:\n{tikz_code}\n\n"
-                f"--- TikZ Compile Error Log ---\n{compile_error_log or last_log}\n\n"
+                f"<ERROR_START>\n{error_excerpt}\n<ERROR_END>\n\n"
                 f"Original input to depict:\n{input_code}\n"
                 "Please provide feedback and actionable suggestions for the generator to improve."
             )
@@ -217,55 +420,49 @@ def run_stream(input_code: str, provider_choice: str):
             if contains_approved(ai_msg_critic):
                 yield {"type": "final", "tikz": tikz_code}
                 return
-            # If not approved, loop back with critic feedback
+            # If not approved, loop back with the error and critic feedback as a repair task
             msg_to_generator = (
-                "External critic feedback indicates issues remain. Please revise the diagram accordingly.\n\n"
+                "Your last TikZ code failed to compile. Fix the error below with the smallest "
+                "possible edit: keep the layout, content and styling that already work, and do "
+                "not rewrite unrelated parts.\n\n"
+                f"<ERROR_START>\n{error_excerpt}\n<ERROR_END>\n\n"
+                "External critic feedback:\n"
                 + ai_msg_critic.strip() +
                 "\n\nReturn ONLY a single fenced LaTeX block (```latex ... ```)."
             )
-            max_iter += 1
+            if not _spend("compile_fail"):
+                yield {"type": "log", "text": "[workflow] Compile retry budget exhausted. Returning the latest TikZ."}
+                break
             continue
 
         # Update tikz_code to the successfully compiled variant
         tikz_code = chosen_variant[1]
-        # Stream the compiled-accepted TikZ variant
-        yield {"type": "tikz", "tikz": tikz_code, "stage": "compiled"}
+        # Stream the compiled-accepted TikZ variant along with its compiled bytes
+        yield {"type": "tikz", "tikz": tikz_code, "stage": "compiled", "outputs": outputs}
 
         # 3) We have a JPEG or at least a PDF (if rasterizer missing)
-        jpeg_b64 = base64.b64encode(jpeg_bytes).decode("ascii") if jpeg_bytes else ""
-
-        # Check aspect ratio of the image
-        PILImage = _pillow_available()
-        if jpeg_b64 and PILImage is not None:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".jpeg") as temp_jpeg:
-                temp_jpeg.write(jpeg_bytes)
-                temp_jpeg_path = temp_jpeg.name
+        if jpeg_bytes:
+            width, height = _jpeg_size(jpeg_bytes)
+            if _extreme_aspect(width, height):
+                yield {"type": "log", "text": f"[Quality] Extreme aspect ratio detected ({width}x{height}). Requesting generator to adjust."}
+                msg_to_generator = (
+                    f"The generated image ({width}x{height} px) has an extreme aspect ratio exceeding 5:1 or 1:5. Please adjust the TikZ code to produce a more balanced diagram.\n\n"
+                    f"Last TikZ source:\n{tikz_code}\n"
+                )
+                # Let the generator see the rendered diagram it is adjusting
+                jpeg_b64 = _jpeg_b64(jpeg_bytes)
+                if not _spend("aspect_ratio"):
+                    yield {"type": "log", "text": "[workflow] Aspect-ratio retry budget exhausted. Returning the latest TikZ."}
+                    break
+                continue
 
-            try:
-                with PILImage.open(temp_jpeg_path) as img:
-                    width, height = img.size
-                    aspect_ratio = max(width / height, height / width)
-                    if aspect_ratio > 5:
-                        yield {"type": "log", "text": f"[Quality] Extreme aspect ratio detected ({width}x{height}). Requesting generator to adjust."}
-                        msg_to_generator = (
-                            "The generated image has an extreme aspect ratio exceeding 5:1 or 1:5. Please adjust the TikZ code to produce a more balanced diagram.\n\n"
-                            f"Last TikZ source:\n{tikz_code}\n"
-                        )
-                        max_iter += 1
-                        # Defer file cleanup to finally; just loop again
-                        continue
-            finally:
-                try:
-                    if os.path.exists(temp_jpeg_path):
-                        os.unlink(temp_jpeg_path)
-                except Exception:
-                    pass
+        # Encoded only now that the image passed the gate and goes to the critic
+        jpeg_b64 = _jpeg_b64(jpeg_bytes) if jpeg_bytes else ""
 
         # If stop was requested after compile, return immediately with compiled TikZ
-        if terminate_workflow:
+        if terminate_workflow():
             yield {"type": "log", "text": "[workflow] Stop requested after compile. Returning compiled TikZ without critique."}
             yield {"type": "final", "tikz": tikz_code}
-            reset_workflow_termination()
             return
 
         # 4) Ask external Critic (with the final image)
@@ -280,32 +477,52 @@ def run_stream(input_code: str, provider_choice: str):
             + f"{input_code}\n"
         )
         # Respect stop before invoking critic
-        if terminate_workflow:
+        if terminate_workflow():
             yield {"type": "log", "text": "[workflow] Stop requested before critic. Returning latest TikZ."}
             yield {"type": "final", "tikz": tikz_code}
-            reset_workflow_termination()
             return
 
-        ai_msg_critic = critic_agent.invoke(critic_prompt, image=jpeg_b64 if jpeg_b64 else None)
+        spec_agent, spec_future = None, None
+        if batched_verdict is not None:
+            # This diagram was already reviewed alongside the other candidates
+            ai_msg_critic, approved = batched_verdict
+        else:
+            # Rejection is the common outcome, so draft the next revision on a fork of the
+            # generator while the critic works; it gets the previous round's critique
+            if SPECULATIVE_REVISION and jpeg_b64:
+                feedback = f"\n\nEarlier critic feedback to take into account:\n{carried_feedback}" if carried_feedback else ""
+                spec_agent = generator_agent.fork()
+                spec_future = _SPECULATIVE_POOL.submit(spec_agent.invoke, _SELF_REVIEW_MSG.format(feedback=feedback), image=jpeg_b64)
+
+            ai_msg_critic = critic_agent.invoke(critic_prompt, image=jpeg_b64 if jpeg_b64 else None)
+            approved = contains_approved(ai_msg_critic)
         yield {"type": "log", "text": f"[Critic]\n{ai_msg_critic}"}
-        if contains_approved(ai_msg_critic):
+        if approved:
+            # Any speculative draft is simply discarded
             yield {"type": "final", "tikz": tikz_code}
-            reset_workflow_termination()
             return
 
+        if spec_future is not None:
+            try:
+                speculative_reply = spec_future.result()
+                generator_agent = spec_agent
+                carried_feedback = ai_msg_critic.strip()
+            except Exception as e:
+                print(f"[ERROR] Speculative revision failed (iteration {iteration}): {e}")
+                speculative_reply = None
+
         # If critic rejected, loop back with the critic's full feedback
         msg_to_generator = (
             "External critic feedback indicates issues remain. Please revise the diagram accordingly.\n\n"
             + ai_msg_critic.strip() +
             "\n\nReturn ONLY a single fenced LaTeX block (```latex ... ```)."
         )
-        max_iter += 1
+        if not _spend("critic_reject"):
+            yield {"type": "log", "text": "[workflow] Revision budget exhausted. Returning the latest TikZ."}
+            break
 
     # If we exit the loop without approval, yield the last TikZ (best effort)
     yield {"type": "final", "tikz": tikz_code}
-    
-    # Reset the termination flag after the workflow ends
-    reset_workflow_termination()
     return
 
 
@@ -320,17 +537,32 @@ def run(input_code: str, provider_choice: str) -> str:
             final_tikz = evt.get("tikz", "")
     return final_tikz
 
+# Explicit uppercase negatives: DISAPPROVED, NOT APPROVED, DO/DON'T/CANNOT/WILL NOT APPROVE(D)
+_NEGATIVE_APPROVE_RE = re.compile(
+    r"\bDISAPPROVED\b"
+    r"|\bNOT\s+APPROVED\b"
+    r"|\b(?:DO\s+NOT|DON'T|CANNOT|WILL\s+NOT)\s+APPROVE(D)?\b"
+)
+_APPROVE_RE = re.compile(r"\bAPPROVE(D)?\b")
+
+def _fenced_block(text: str, opener: str) -> Optional[str]:
+    """Body of the first ``opener ... ``` block, or None if there is none."""
+    start = text.find(opener)
+    if start == -1:
+        return None
+    start += len(opener)
+    end = text.find("```", start)
+    return text[start:end] if end != -1 else None
+
 def extract_tikz_code(ai_msg: str) -> str:
     """Extract LaTeX from a ```latex fenced block (or any fenced block as fallback)."""
     if not ai_msg:
         return ""
-    m = re.search(r"```latex\s*([\s\S]*?)```", ai_msg)
-    if m:
-        return m.group(1).strip()
-    m2 = re.search(r"```\s*([\s\S]*?)```", ai_msg)
-    if m2:
-        return m2.group(1).strip()
-    return ""
+    # Plain substring scans; same leftmost, shortest match as the fence regexes were
+    body = _fenced_block(ai_msg, "```latex")
+    if body is None:
+        body = _fenced_block(ai_msg, "```")
+    return body.strip() if body is not None else ""
 
 def contains_approved(text: str) -> bool:
     """Return True if the critic indicates approval with uppercase keywords.
@@ -340,23 +572,15 @@ def contains_approved(text: str) -> bool:
     - Allow punctuation or whitespace boundaries (word boundaries cover this).
     - Avoid obvious uppercase negatives like NOT APPROVED / DISAPPROVED / DO NOT APPROVE.
     """
-    if not text:
+    # Every match below needs the literal "APPROVE"; most rejections don't contain it
+    if not text or "APPROVE" not in text:
         return False
 
     t = text.strip()
 
     # Guard against explicit uppercase negatives
-    negative_patterns_cs = [
-        r"\bDISAPPROVED\b",
-        r"\bNOT\s+APPROVED\b",
-        r"\bDO\s+NOT\s+APPROVE(D)?\b",
-        r"\bDON'T\s+APPROVE(D)?\b",
-        r"\bCANNOT\s+APPROVE(D)?\b",
-        r"\bWILL\s+NOT\s+APPROVE(D)?\b",
-    ]
-    for pat in negative_patterns_cs:
-        if re.search(pat, t):
-            return False
+    if _NEGATIVE_APPROVE_RE.search(t):
+        return False
 
     # Positive: uppercase APPROVE or APPROVED, whole word, case-sensitive
-    return bool(re.search(r"\bAPPROVE(D)?\b", t))
\ No newline at end of file
+    return bool(_APPROVE_RE.search(t))
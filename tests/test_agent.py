@@ -0,0 +1,47 @@
+import unittest
+from unittest import mock
+
+from llm import agent
+
+
+class HistoryTrimTest(unittest.TestCase):
+    def _agent(self):
+        a = agent.Agent.__new__(agent.Agent)
+        a.messages = [{"role": "system", "content": [{"type": "text", "text": "prompt"}]}]
+        return a
+
+    def _turn(self, a, n):
+        a._remember_turn({"role": "user", "content": [{"type": "text", "text": f"user {n}"}]}, f"reply {n}")
+
+    def _texts(self, a):
+        return [m["content"][0]["text"] for m in a.messages]
+
+    def test_first_turn_survives_trimming(self):
+        a = self._agent()
+        for n in range(agent.MAX_HISTORY_TURNS + 3):
+            self._turn(a, n)
+        texts = self._texts(a)
+        self.assertEqual(len(a.messages), 1 + 2 * agent.MAX_HISTORY_TURNS)
+        self.assertEqual(texts[:3], ["prompt", "user 0", "reply 0"])
+        last = agent.MAX_HISTORY_TURNS + 2
+        self.assertEqual(texts[-2:], [f"user {last}", f"reply {last}"])
+        self.assertEqual([m["role"] for m in a.messages[1:]], ["user", "assistant"] * agent.MAX_HISTORY_TURNS)
+
+    def test_recent_turns_are_kept_in_order(self):
+        a = self._agent()
+        with mock.patch.object(agent, "MAX_HISTORY_TURNS", 3):
+            for n in range(6):
+                self._turn(a, n)
+        self.assertEqual(self._texts(a)[1:], ["user 0", "reply 0", "user 4", "reply 4", "user 5", "reply 5"])
+
+    def test_images_are_not_kept_in_history(self):
+        a = self._agent()
+        a._remember_turn({"role": "user", "content": [
+            {"type": "text", "text": "look"},
+            {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,AAAA"}},
+        ]}, "ok")
+        self.assertEqual(a.messages[1]["content"], [{"type": "text", "text": "look"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from tikzconvert import compile as tc
+from tikzconvert.compile import _postprocess, _static_validate, tikz_to_formats
+
+
+class PostprocessTest(unittest.TestCase):
+    def test_clean_source_is_returned_unchanged(self):
+        src = "\\begin{tikzpicture}\n\\draw (0,0) -- (1,1);\n\\end{tikzpicture}"
+        self.assertIs(_postprocess(src), src)
+
+    def test_text_after_end_document_is_trimmed(self):
+        src = "\\documentclass{standalone}\n\\begin{document}\nx\n\\end{document}\nSome trailing prose."
+        self.assertEqual(_postprocess(src), "\\documentclass{standalone}\n\\begin{document}\nx\n\\end{document}")
+
+    def test_blank_lines_after_end_document_are_left_alone(self):
+        src = "\\begin{document}\nx\n\\end{document}\n\n"
+        self.assertIs(_postprocess(src), src)
+
+    def test_open_environments_are_closed_innermost_first(self):
+        src = "\\begin{document}\n\\begin{tikzpicture}\n\\draw (0,0) -- (1,1);"
+        self.assertEqual(_postprocess(src), src + "\n\\end{tikzpicture}\n\\end{document}")
+
+    def test_misnested_environments_are_not_touched(self):
+        src = "\\begin{document}\n\\begin{tikzpicture}\n\\end{document}\n"
+        self.assertIs(_postprocess(src), src)
+
+    def test_environments_opened_in_macros_are_not_closed(self):
+        src = "\\newcommand{\\pic}{\\begin{tikzpicture}}\n\\begin{document}\n\\end{document}"
+        self.assertIs(_postprocess(src), src)
+
+    def test_commented_out_environments_are_ignored(self):
+        src = "\\begin{tikzpicture}\n% \\begin{scope}\n\\end{tikzpicture}"
+        self.assertIs(_postprocess(src), src)
+
+    def test_repeated_draw_lines_are_kept(self):
+        src = "\\begin{tikzpicture}\n\\draw (0,0) -- (1,1);\n\\draw (0,0) -- (1,1);\n\\end{tikzpicture}"
+        self.assertIs(_postprocess(src), src)
+
+    def test_unbalanced_last_line_is_kept(self):
+        src = "\\begin{tikzpicture}\n\\node at (0,0) {label\n\\end{tikzpicture}"
+        self.assertIs(_postprocess(src), src)
+
+
+class StaticValidateTest(unittest.TestCase):
+    DOC = "\\documentclass{standalone}\n\\begin{document}\n%s\n\\end{document}"
+
+    def test_well_formed_document_passes(self):
+        self.assertIsNone(_static_validate(self.DOC % "\\begin{tikzpicture}\\end{tikzpicture}"))
+
+    def test_missing_preamble_is_reported(self):
+        self.assertEqual(_static_validate("\\begin{document}\\end{document}"), "! LaTeX Error: Missing \\documentclass.")
+        self.assertEqual(_static_validate("\\documentclass{standalone}"), "! LaTeX Error: Missing \\begin{document}.")
+        self.assertIn("appears before", _static_validate("\\begin{document}\\documentclass{article}\\end{document}"))
+
+    def test_mismatched_environment_reports_both_lines(self):
+        error = _static_validate(self.DOC % "\\begin{tikzpicture}\n\\end{scope}")
+        self.assertEqual(error, "! LaTeX Error: \\begin{tikzpicture} on input line 3 ended by \\end{scope} on input line 4.")
+
+    def test_unmatched_end_and_unclosed_begin_are_reported(self):
+        error = _static_validate("\\documentclass{standalone}\n\\end{scope}\n\\begin{document}\n\\end{document}")
+        self.assertEqual(error, "! LaTeX Error: \\end{scope} on input line 2 has no matching \\begin.")
+        error = _static_validate("\\documentclass{standalone}\n\\begin{document}\n\\begin{tikzpicture}")
+        self.assertIn("\\begin{tikzpicture} on input line 3 is never ended", error)
+
+    def test_comments_and_macro_definitions_are_not_checked(self):
+        self.assertIsNone(_static_validate(self.DOC % "% \\begin{scope}"))
+        self.assertIsNone(_static_validate(self.DOC % "\\newcommand{\\pic}{\\begin{tikzpicture}}"))
+
+    def test_invalid_document_skips_the_toolchain(self):
+        with mock.patch.object(tc, "CACHE_DIR", ""), mock.patch.object(tc, "_compile_pdf") as compile_pdf:
+            outputs = tikz_to_formats("\\begin{tikzpicture}\n\\begin{scope}\n\\end{tikzpicture}", formats=("pdf",))
+        compile_pdf.assert_not_called()
+        self.assertIn(b"static check failed", outputs["log"])
+
+
+class CompileCacheTest(unittest.TestCase):
+    SRC = "\\begin{tikzpicture}\n\\draw (0,0) -- (%d,1);\n\\end{tikzpicture}"
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        patcher = mock.patch.object(tc, "CACHE_DIR", self._tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.compiles = 0
+
+    def _fake_compile_pdf(self, ok=True):
+        def compile_pdf(td):
+            self.compiles += 1
+            pdf_path = os.path.join(td, "main.pdf")
+            if ok:
+                with open(pdf_path, "wb") as f:
+                    f.write(b"%PDF")
+            return ok, pdf_path, b"log"
+        return mock.patch.object(tc, "_compile_pdf", compile_pdf)
+
+    def test_repeated_source_is_served_from_cache(self):
+        with self._fake_compile_pdf():
+            first = tikz_to_formats(self.SRC % 1, formats=("tikz", "pdf"))
+            second = tikz_to_formats(self.SRC % 1, formats=("tikz", "pdf"))
+        self.assertEqual(self.compiles, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(second["pdf"], b"%PDF")
+
+    def test_different_sources_do_not_share_entries(self):
+        with self._fake_compile_pdf():
+            tikz_to_formats(self.SRC % 1, formats=("pdf",))
+            tikz_to_formats(self.SRC % 2, formats=("pdf",))
+        self.assertEqual(self.compiles, 2)
+
+    def test_failed_compiles_are_not_cached(self):
+        with self._fake_compile_pdf(ok=False):
+            tikz_to_formats(self.SRC % 1, formats=("pdf",))
+            tikz_to_formats(self.SRC % 1, formats=("pdf",))
+        self.assertEqual(self.compiles, 2)
+        self.assertEqual(os.listdir(self._tmp.name), [])
+
+    def test_entry_missing_a_wanted_format_is_recompiled(self):
+        with self._fake_compile_pdf(), mock.patch.object(tc, "_produce_jpeg_from_pdf", return_value=(True, b"jpeg")):
+            tikz_to_formats(self.SRC % 1, formats=("pdf",))
+            outputs = tikz_to_formats(self.SRC % 1, formats=("pdf", "jpeg"))
+        self.assertEqual(self.compiles, 2)
+        self.assertEqual(outputs["jpeg"], b"jpeg")
+
+    def test_least_recently_used_entries_are_evicted(self):
+        with self._fake_compile_pdf(), mock.patch.object(tc, "CACHE_MAX_ENTRIES", 2):
+            for n in (1, 2):
+                tikz_to_formats(self.SRC % n, formats=("pdf",))
+            # Backdate entry 1, then touch it with a hit so entry 2 is the oldest
+            for i, entry in enumerate(sorted(os.scandir(self._tmp.name), key=lambda e: e.stat().st_mtime)):
+                os.utime(entry.path, (1000 + i, 1000 + i))
+            tikz_to_formats(self.SRC % 1, formats=("pdf",))
+            tikz_to_formats(self.SRC % 3, formats=("pdf",))
+            self.assertEqual(len(os.listdir(self._tmp.name)), 2)
+            self.assertEqual(self.compiles, 3)
+            tikz_to_formats(self.SRC % 1, formats=("pdf",))
+            self.assertEqual(self.compiles, 3)
+            tikz_to_formats(self.SRC % 2, formats=("pdf",))
+            self.assertEqual(self.compiles, 4)
+
+
+class WorkdirReuseTest(unittest.TestCase):
+    SRC = "\\begin{tikzpicture}\n\\draw (0,0) -- (1,1);\n\\end{tikzpicture}"
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.workdir = self._tmp.name
+        for name in ("main.tex", "main.aux", "main.fdb_latexmk", "main.pdf"):
+            with open(os.path.join(self.workdir, name), "w") as f:
+                f.write("stale")
+        patcher = mock.patch.object(tc, "CACHE_DIR", "")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self._tmp.cleanup)
+
+    def _compile(self, ok):
+        def fake_compile_pdf(td):
+            pdf_path = os.path.join(td, "main.pdf")
+            if ok:
+                with open(pdf_path, "wb") as f:
+                    f.write(b"%PDF")
+            return ok, pdf_path, b"log"
+        with mock.patch.object(tc, "_compile_pdf", fake_compile_pdf):
+            return tikz_to_formats(self.SRC, formats=("tikz", "pdf"), workdir=self.workdir)
+
+    def test_failed_compile_removes_auxiliary_files(self):
+        outputs = self._compile(ok=False)
+        self.assertNotIn("pdf", outputs)
+        self.assertEqual(sorted(os.listdir(self.workdir)), ["main.tex"])
+
+    def test_successful_compile_keeps_auxiliary_files(self):
+        outputs = self._compile(ok=True)
+        self.assertEqual(outputs["pdf"], b"%PDF")
+        self.assertIn("main.aux", os.listdir(self.workdir))
+        self.assertIn("main.fdb_latexmk", os.listdir(self.workdir))
+
+    def test_stale_pdf_is_not_reported_as_output(self):
+        with mock.patch.object(tc, "_compile_pdf", lambda td: (False, os.path.join(td, "main.pdf"), b"")):
+            outputs = tikz_to_formats(self.SRC, formats=("tikz", "pdf"), workdir=self.workdir)
+        self.assertNotIn("pdf", outputs)
+
+
+if __name__ == "__main__":
+    unittest.main()
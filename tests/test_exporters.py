@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from frontend import exporters
+
+
+class OutputEvictionTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        for patcher in (
+            mock.patch.object(exporters, "OUTPUT_ROOT", self._tmp.name),
+            mock.patch.object(exporters, "_recent_dirs", exporters.deque()),
+            mock.patch.object(exporters, "_swept", True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _save_at(self, now):
+        with mock.patch.object(exporters.time, "monotonic", return_value=now):
+            return exporters.save_outputs({"tex": b"x"})["tex"]
+
+    def test_many_sessions_do_not_evict_recent_outputs(self):
+        paths = [self._save_at(float(i)) for i in range(50)]
+        self.assertTrue(all(os.path.exists(p) for p in paths))
+
+    def test_outputs_are_evicted_by_age(self):
+        old = self._save_at(0.0)
+        recent = self._save_at(exporters.OUTPUT_MAX_AGE_SECONDS - 1.0)
+        self._save_at(exporters.OUTPUT_MAX_AGE_SECONDS + 0.5)
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(recent))
+
+    def test_files_are_written(self):
+        paths = exporters.save_outputs({"tex": b"tikz", "pdf": b"%PDF"})
+        self.assertTrue(paths["tex"].endswith("diagram.tikz"))
+        with open(paths["pdf"], "rb") as f:
+            self.assertEqual(f.read(), b"%PDF")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import importlib.util
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+HAVE_DEPS = all(importlib.util.find_spec(name) for name in ("llama_index", "dotenv"))
+if HAVE_DEPS:
+    from vector_db import index as vindex
+
+
+def _chunks(documents, transformations):
+    return [SimpleNamespace(ref_doc_id=doc.doc_id, id_=None) for doc in documents for _ in range(2)]
+
+
+@unittest.skipUnless(HAVE_DEPS, "llama_index and python-dotenv are required")
+class IngestDedupTest(unittest.TestCase):
+    def setUp(self):
+        self.store = mock.Mock()
+        for patcher in (
+            mock.patch.object(vindex, "VECTOR_DB_READY", True),
+            mock.patch.object(vindex, "VECTOR_DB_ERROR", None),
+            mock.patch.object(vindex, "_ingest_index", self.store),
+            mock.patch.object(vindex, "_ingested_ids", set()),
+            mock.patch.object(vindex, "INGEST_GENERATION", 0),
+            mock.patch("llama_index.core.ingestion.run_transformations", _chunks),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        vindex.VECTOR_DB_INIT_DONE.set()
+
+    def _inserted_ids(self):
+        return [node.id_ for call in self.store.insert_nodes.call_args_list for node in call.args[0]]
+
+    def test_duplicates_within_an_upload_are_inserted_once(self):
+        self.assertEqual(vindex.add_documents_to_vector_db(["alpha", " alpha\n", "beta", "  "]), 2)
+        ids = self._inserted_ids()
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(len(set(ids)), 4)
+        self.assertEqual(vindex.INGEST_GENERATION, 1)
+
+    def test_reuploads_are_skipped(self):
+        vindex.add_documents_to_vector_db(["alpha"])
+        self.assertEqual(vindex.add_documents_to_vector_db(["alpha"]), 0)
+        self.assertEqual(self.store.insert_nodes.call_count, 1)
+        self.assertEqual(vindex.INGEST_GENERATION, 1)
+
+    def test_node_ids_are_deterministic(self):
+        vindex.add_documents_to_vector_db(["alpha"])
+        first = self._inserted_ids()
+        vindex._ingested_ids.clear()
+        vindex.add_documents_to_vector_db(["alpha"])
+        self.assertEqual(self._inserted_ids(), first + first)
+
+    def test_failed_insert_can_be_retried(self):
+        self.store.insert_nodes.side_effect = [RuntimeError("db down"), None]
+        with self.assertRaises(RuntimeError):
+            vindex.add_documents_to_vector_db(["alpha"])
+        self.assertEqual(vindex.INGEST_GENERATION, 0)
+        self.assertEqual(vindex.add_documents_to_vector_db(["alpha"]), 1)
+        self.assertEqual(vindex.INGEST_GENERATION, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+import asyncio
+import importlib.util
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+HAVE_DEPS = all(importlib.util.find_spec(name) for name in ("llama_index", "dotenv"))
+if HAVE_DEPS:
+    from vector_db import index as vindex
+    from vector_db import rag
+
+
+@unittest.skipUnless(HAVE_DEPS, "llama_index and python-dotenv are required")
+class RagResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        rag.clear_rag_cache()
+        self.addCleanup(rag.clear_rag_cache)
+        self.calls = []
+
+        def perform(query, top_k):
+            self.calls.append((query, top_k))
+            return f"result {len(self.calls)}", True
+
+        patcher = mock.patch.object(rag, "_perform_rag", perform)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeated_query_is_served_from_cache(self):
+        self.assertEqual(rag.perform_rag("Conv layers", 5), "result 1")
+        self.assertEqual(rag.perform_rag("  conv   LAYERS ", 5), "result 1")
+        self.assertEqual(len(self.calls), 1)
+
+    def test_top_k_is_part_of_the_key(self):
+        rag.perform_rag("conv layers", 5)
+        rag.perform_rag("conv layers", 3)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_entries_expire_after_the_ttl(self):
+        with mock.patch.object(rag.time, "monotonic", return_value=1000.0):
+            rag.perform_rag("conv layers")
+        with mock.patch.object(rag.time, "monotonic", return_value=1000.0 + rag.RAG_CACHE_TTL - 1):
+            rag.perform_rag("conv layers")
+        self.assertEqual(len(self.calls), 1)
+        with mock.patch.object(rag.time, "monotonic", return_value=1000.0 + rag.RAG_CACHE_TTL):
+            self.assertEqual(rag.perform_rag("conv layers"), "result 2")
+
+    def test_ingest_invalidates_cached_results(self):
+        rag.perform_rag("conv layers")
+        with mock.patch.object(vindex, "INGEST_GENERATION", vindex.INGEST_GENERATION + 1):
+            rag.perform_rag("conv layers")
+        self.assertEqual(len(self.calls), 2)
+
+    def test_clear_rag_cache_drops_entries(self):
+        rag.perform_rag("conv layers")
+        rag.clear_rag_cache()
+        rag.perform_rag("conv layers")
+        self.assertEqual(len(self.calls), 2)
+
+    def test_failures_are_not_cached(self):
+        with mock.patch.object(rag, "_perform_rag", return_value=("Vector DB is not ready.", False)) as perform:
+            rag.perform_rag("conv layers")
+            rag.perform_rag("conv layers")
+        self.assertEqual(perform.call_count, 2)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        with mock.patch.object(rag, "RAG_CACHE_SIZE", 2):
+            rag.perform_rag("a")
+            rag.perform_rag("b")
+            rag.perform_rag("a")
+            rag.perform_rag("c")
+            rag.perform_rag("a")
+            self.assertEqual(len(self.calls), 3)
+            rag.perform_rag("b")
+        self.assertEqual(len(self.calls), 4)
+
+    def test_async_variant_shares_the_cache(self):
+        rag.perform_rag("conv layers")
+        with mock.patch.object(rag, "_aperform_rag") as aperform:
+            self.assertEqual(asyncio.run(rag.aperform_rag("conv layers")), "result 1")
+        aperform.assert_not_called()
+
+
+@unittest.skipUnless(HAVE_DEPS, "llama_index and python-dotenv are required")
+class EmbedBatcherTest(unittest.TestCase):
+    def test_concurrent_requests_share_a_batch(self):
+        release = threading.Event()
+        batches = []
+
+        def embed_batch(texts):
+            batches.append(list(texts))
+            if len(batches) == 1:
+                release.wait(5)
+            return [[len(t)] for t in texts]
+
+        batcher = rag._EmbedBatcher(embed_batch, max_batch=4, window=0.05)
+        results = {}
+
+        def embed(text):
+            results[text] = batcher.embed(text)
+
+        first = threading.Thread(target=embed, args=("a",))
+        first.start()
+        while not batches:
+            time.sleep(0.001)
+        # Queue five more while the first batch is still running
+        rest = [threading.Thread(target=embed, args=("b" * n,)) for n in range(2, 7)]
+        for t in rest:
+            t.start()
+        while batcher._queue.qsize() < 5:
+            time.sleep(0.001)
+        release.set()
+        for t in [first] + rest:
+            t.join(5)
+
+        self.assertEqual([len(b) for b in batches], [1, 4, 1])
+        self.assertEqual(results, {"b" * n: [n] for n in range(2, 7)} | {"a": [1]})
+
+    def test_errors_reach_every_caller_and_the_worker_survives(self):
+        fail = [True]
+
+        def embed_batch(texts):
+            if fail[0]:
+                raise ValueError("model failed")
+            return [[0.0] for _ in texts]
+
+        batcher = rag._EmbedBatcher(embed_batch, max_batch=4, window=0.0)
+        with self.assertRaises(ValueError):
+            batcher.embed("q")
+        fail[0] = False
+        self.assertEqual(batcher.embed("q"), [0.0])
+
+
+@unittest.skipUnless(HAVE_DEPS, "llama_index and python-dotenv are required")
+class QueryBatchPrefixTest(unittest.TestCase):
+    def _model(self, **attrs):
+        return SimpleNamespace(**{"model_name": "BAAI/bge-small-en-v1.5", "query_instruction": None, "text_instruction": None, **attrs})
+
+    def test_bge_query_instruction_is_kept(self):
+        if importlib.util.find_spec("llama_index.embeddings.huggingface") is None:
+            self.skipTest("llama-index-embeddings-huggingface is required")
+        from llama_index.embeddings.huggingface.utils import get_query_instruct_for_model_name
+
+        prefix = rag._query_batch_prefix(self._model())
+        self.assertEqual(prefix, get_query_instruct_for_model_name("BAAI/bge-small-en-v1.5"))
+        self.assertTrue(prefix)
+        self.assertEqual(rag._query_batch_prefix(self._model(query_instruction="Query: ")), "Query: ")
+
+    def test_text_instruction_disables_batching(self):
+        self.assertIsNone(rag._query_batch_prefix(self._model(query_instruction="q: ", text_instruction="t: ")))
+
+    def test_unknown_model_falls_back_to_single_queries(self):
+        model = SimpleNamespace(get_query_embedding=lambda q: [len(q)])
+        self.assertIsNone(rag._query_batch_prefix(model))
+        with mock.patch.object(rag, "Settings", SimpleNamespace(embed_model=model)):
+            self.assertEqual(rag._embed_queries(["a", "bb"]), [[1], [2]])
+
+
+if __name__ == "__main__":
+    unittest.main()
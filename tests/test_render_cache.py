@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from frontend import cache
+
+
+class RenderCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        for patcher in (
+            mock.patch.object(cache, "RENDERS_DIR", self._tmp.name),
+            mock.patch.object(cache, "_memory", cache.OrderedDict()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_round_trip_from_disk(self):
+        outputs = {"tex": b"\\draw;", "pdf": b"%PDF", "jpeg": b"\xff\xd8"}
+        cache.store_outputs("k", outputs)
+        cache._memory.clear()
+        self.assertEqual(cache.get_cached_outputs("k"), outputs)
+        self.assertEqual(sorted(os.listdir(os.path.join(self._tmp.name, "k"))), ["main.jpg", "main.pdf", "main.tex"])
+
+    def test_runs_without_artefacts_are_not_stored(self):
+        cache.store_outputs("k", {"tex": b"% failed"})
+        self.assertIsNone(cache.get_cached_outputs("k"))
+        self.assertEqual(os.listdir(self._tmp.name), [])
+
+    def test_memory_is_bounded(self):
+        with mock.patch.object(cache, "MAX_MEMORY_ENTRIES", 2):
+            for key in ("a", "b", "c"):
+                cache._remember(key, {"pdf": key.encode()})
+        self.assertEqual(list(cache._memory), ["b", "c"])
+
+    def test_pickle_files_are_ignored(self):
+        with open(os.path.join(self._tmp.name, "k.pkl"), "wb") as f:
+            f.write(b"not loaded")
+        self.assertIsNone(cache.get_cached_outputs("k"))
+
+
+class CacheKeyTest(unittest.TestCase):
+    def test_key_depends_on_inputs(self):
+        base = cache.cache_key("code", "provider")
+        self.assertEqual(base, cache.cache_key("code", "provider"))
+        self.assertNotEqual(base, cache.cache_key("other code", "provider"))
+        self.assertNotEqual(base, cache.cache_key("code", "other provider"))
+
+    def test_key_depends_on_workflow_settings(self):
+        base = cache.cache_key("code", "provider")
+        for name, value in (
+            ("NUM_CANDIDATES", cache.NUM_CANDIDATES + 1),
+            ("BATCHED_CANDIDATE_CRITIQUE", not cache.BATCHED_CANDIDATE_CRITIQUE),
+            ("SPECULATIVE_REVISION", not cache.SPECULATIVE_REVISION),
+            ("ITER_BUDGETS", {"critic_reject": 99}),
+        ):
+            with mock.patch.object(cache, name, value):
+                self.assertNotEqual(base, cache.cache_key("code", "provider"), name)
+
+    def test_key_depends_on_rag_data(self):
+        base = cache.cache_key("code", "provider")
+        fake_index = mock.Mock(INGEST_GENERATION=3)
+        with mock.patch.dict("sys.modules", {"vector_db.index": fake_index}):
+            self.assertNotEqual(base, cache.cache_key("code", "provider"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import importlib
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import constants
+from llm import agent
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        for patcher in (
+            mock.patch.object(agent, "RESPONSE_CACHE_DIR", self._tmp.name),
+            mock.patch.object(agent, "_response_cache", agent.OrderedDict()),
+            mock.patch.object(agent, "_response_cache_stats", {"hits": 0, "misses": 0}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _at(self, now):
+        return mock.patch.object(agent.time, "time", return_value=now)
+
+    def test_hit_within_ttl(self):
+        with self._at(1000.0):
+            agent._store_response("k", "reply")
+        with self._at(1059.0):
+            self.assertEqual(agent._cached_response("k", ttl=60), "reply")
+        self.assertEqual(agent.response_cache_stats()["hits"], 1)
+
+    def test_entry_expires_after_ttl(self):
+        with self._at(1000.0):
+            agent._store_response("k", "reply")
+        with self._at(1060.0):
+            self.assertIsNone(agent._cached_response("k", ttl=60))
+        self.assertNotIn("k", agent._response_cache)
+
+    def test_entry_survives_restart_on_disk(self):
+        with self._at(1000.0):
+            agent._store_response("k", "reply")
+        agent._response_cache.clear()
+        self.assertTrue(os.path.exists(os.path.join(self._tmp.name, "k.json")))
+        with self._at(1001.0):
+            self.assertEqual(agent._cached_response("k", ttl=60), "reply")
+
+    def test_memory_is_bounded(self):
+        with mock.patch.object(agent, "LLM_RESPONSE_CACHE_SIZE", 2):
+            for key in ("a", "b", "c"):
+                agent._store_response(key, key)
+        self.assertEqual(list(agent._response_cache), ["b", "c"])
+
+
+class ResponseCacheDefaultTest(unittest.TestCase):
+    def test_cache_is_off_unless_configured(self):
+        self.addCleanup(importlib.reload, constants)
+        env = {k: v for k, v in os.environ.items() if k != "ARCHGEN_LLM_CACHE_TTL"}
+        with mock.patch.dict(os.environ, env, clear=True):
+            self.assertEqual(importlib.reload(constants).LLM_RESPONSE_CACHE_TTL, 0)
+        with mock.patch.dict(os.environ, {"ARCHGEN_LLM_CACHE_TTL": "3600"}):
+            self.assertEqual(importlib.reload(constants).LLM_RESPONSE_CACHE_TTL, 3600)
+
+
+if __name__ == "__main__":
+    unittest.main()
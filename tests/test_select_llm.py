@@ -0,0 +1,26 @@
+import importlib.util
+import unittest
+from unittest import mock
+
+from llm import select_llm
+
+HAVE_OLLAMA = all(importlib.util.find_spec(name) for name in ("httpx", "langchain_ollama"))
+
+
+@unittest.skipUnless(HAVE_OLLAMA, "langchain-ollama is required")
+class OllamaClientTest(unittest.TestCase):
+    def test_pool_limits_are_passed_to_the_client(self):
+        import httpx
+
+        with mock.patch("langchain_ollama.ChatOllama") as chat_ollama:
+            select_llm._chat_model.__wrapped__("ollama:qwen3:8b")
+        kwargs = chat_ollama.call_args.kwargs
+        self.assertEqual(kwargs["model"], "qwen3:8b")
+        limits = kwargs["client_kwargs"]["limits"]
+        self.assertIsInstance(limits, httpx.Limits)
+        self.assertEqual((limits.max_connections, limits.max_keepalive_connections), (64, 32))
+        self.assertEqual(kwargs["client_kwargs"]["timeout"], select_llm.LLM_DEFAULT_TIMEOUT)
+
+
+if __name__ == "__main__":
+    unittest.main()
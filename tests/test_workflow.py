@@ -0,0 +1,107 @@
+import os
+import threading
+import unittest
+from unittest import mock
+
+from llm import workflow
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TIKZ = "\\begin{tikzpicture}\\end{tikzpicture}"
+TIKZ_REPLY = f"```latex\n{TIKZ}\n```"
+RENDERED = {"jpeg": b"jpeg", "pdf": b"pdf"}
+FAILED = {"log": b"! Undefined control sequence."}
+
+
+class FakeAgent:
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = 0
+        self.images = []
+
+    def invoke(self, msg, image=None, images=None):
+        self.calls += 1
+        self.images.append(image)
+        return self.reply
+
+    def fork(self):
+        return self
+
+
+class IterationBudgetTest(unittest.TestCase):
+    def _run(self, generator=None, critic=None, compile_tikz=None, size=(400, 300), stop_event=None):
+        generator = generator or FakeAgent(TIKZ_REPLY)
+        critic = critic or FakeAgent("Needs work.")
+
+        def new_agent(prompt_path, provider_choice, rubrics, cache_ttl=None):
+            return generator if prompt_path == workflow.GENERATOR_PROMPT_PATH else critic
+
+        if compile_tikz is None:
+            compile_tikz = lambda code, workdir=None: dict(RENDERED)
+        with mock.patch.object(workflow, "RUBRICS_PROMPT_PATH", os.path.join(ROOT, "prompts", "rubrics.txt")), \
+                mock.patch.object(workflow, "NUM_CANDIDATES", 1), \
+                mock.patch.object(workflow, "SPECULATIVE_REVISION", False), \
+                mock.patch.object(workflow, "_new_agent", new_agent), \
+                mock.patch.object(workflow, "_latex_available", lambda: True), \
+                mock.patch.object(workflow, "_rasterizer_available", lambda: True), \
+                mock.patch.object(workflow, "_compile_tikz", compile_tikz), \
+                mock.patch.object(workflow, "_jpeg_size", lambda data: size):
+            events = list(workflow.run_stream("model code", "provider", stop_event=stop_event))
+        return generator, critic, events
+
+    def test_responses_without_code_use_the_no_code_budget(self):
+        generator, _, events = self._run(generator=FakeAgent("no code here"))
+        self.assertEqual(generator.calls, workflow.ITER_BUDGETS["no_code"])
+        self.assertEqual(events[-1], {"type": "final", "tikz": ""})
+
+    def test_compile_failures_use_the_compile_budget(self):
+        generator, _, events = self._run(compile_tikz=lambda code, workdir=None: dict(FAILED))
+        self.assertEqual(generator.calls, workflow.ITER_BUDGETS["compile_fail"])
+        self.assertEqual(events[-1], {"type": "final", "tikz": TIKZ})
+
+    def test_extreme_aspect_ratio_uses_its_budget_without_the_critic(self):
+        generator, critic, _ = self._run(size=(1200, 100))
+        self.assertEqual(generator.calls, workflow.ITER_BUDGETS["aspect_ratio"])
+        self.assertEqual(critic.calls, 0)
+        # The retry still shows the generator the rendered diagram
+        self.assertEqual(generator.images, [None, workflow._jpeg_b64(RENDERED["jpeg"])])
+
+    def test_critic_rejections_use_the_revision_budget(self):
+        generator, critic, _ = self._run()
+        self.assertEqual(generator.calls, workflow.ITER_BUDGETS["critic_reject"])
+        self.assertEqual(critic.calls, workflow.ITER_BUDGETS["critic_reject"])
+
+    def test_budgets_are_charged_separately(self):
+        generator = FakeAgent(TIKZ_REPLY)
+        # Only the first round fails to compile
+        compile_tikz = lambda code, workdir=None: dict(FAILED if generator.calls == 1 else RENDERED)
+        self._run(generator=generator, compile_tikz=compile_tikz)
+        self.assertEqual(generator.calls, 1 + workflow.ITER_BUDGETS["critic_reject"])
+
+    def test_approval_ends_the_run(self):
+        generator, critic, events = self._run(critic=FakeAgent("Looks good.\nAPPROVED"))
+        self.assertEqual((generator.calls, critic.calls), (1, 1))
+        self.assertEqual(events[-1], {"type": "final", "tikz": TIKZ})
+
+    def test_stop_event_ends_the_run_before_any_call(self):
+        stop = threading.Event()
+        stop.set()
+        generator, critic, events = self._run(stop_event=stop)
+        self.assertEqual((generator.calls, critic.calls), (0, 0))
+        self.assertEqual(events[-1], {"type": "final", "tikz": ""})
+
+
+class ReplyParsingTest(unittest.TestCase):
+    def test_extract_prefers_latex_fence(self):
+        self.assertEqual(workflow.extract_tikz_code("```\nother\n```\n```latex\n\\draw;\n```"), "\\draw;")
+        self.assertEqual(workflow.extract_tikz_code("```\n\\draw;\n```"), "\\draw;")
+        self.assertEqual(workflow.extract_tikz_code("no fence"), "")
+
+    def test_contains_approved(self):
+        self.assertTrue(workflow.contains_approved("Looks good. APPROVED."))
+        self.assertFalse(workflow.contains_approved("NOT APPROVED"))
+        self.assertFalse(workflow.contains_approved("DISAPPROVED"))
+        self.assertFalse(workflow.contains_approved("approved"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,24 +5,44 @@ raw TikZ source (key 'tikz'). If PDF compiles, we can optionally derive a JPEG
 preview using whatever external converter happens to be installed.
 
 Strategy (progressive enhancement):
+0. Losslessly repair common generation defects (unclosed environments, stray text
+   after \\end{document}) that would otherwise fail the compile.
 1. Normalize input into a full LaTeX standalone document if needed.
 2. Write `main.tex` in a temporary directory.
 3. Attempt PDF via (in order) `tectonic`, `latexmk`, `pdflatex`.
-4. If JPEG requested, attempt (in order) `pdftoppm -jpeg`, `pdftocairo -jpeg`,
-   ImageMagick (`magick` / `convert`), Ghostscript (`gs`). First success wins.
+4. If JPEG requested, render in-process with pypdfium2 when installed, else attempt
+   (in order) `pdftoppm -jpeg`, `pdftocairo -jpeg`, ImageMagick (`magick` /
+   `convert`), Ghostscript (`gs`). First success wins.
 5. Gracefully fall back; never raise unless an unexpected internal error occurs.
 """
 from __future__ import annotations
 
+import hashlib
+import io
 import os
+import re
 import shutil
 import subprocess
 import tempfile
-from typing import Dict, Iterable, List, Tuple
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
 
 class TikzConversionError(Exception):
     pass
 
+# Compiled artefacts are cached on disk by document hash: an identical TikZ source
+# (common across generator retries and repeat requests) skips the LaTeX toolchain.
+# Set ARCHGEN_TIKZ_CACHE_DIR to an empty string to disable.
+CACHE_DIR = os.environ.get(
+    "ARCHGEN_TIKZ_CACHE_DIR",
+    os.path.join(os.environ.get("ARCHGEN_CACHE_DIR", "cache"), "tikz"),
+)
+CACHE_MAX_ENTRIES = 500
+
+# Cached file name per output format
+_CACHE_FILES = {"pdf": "main.pdf", "jpeg": "main.jpg", "log": "log"}
+
 _MIN_DOC = r"""\documentclass[tikz,border=5pt]{standalone}
 \usetikzlibrary{positioning}
 \begin{document}
@@ -30,9 +50,83 @@ _MIN_DOC = r"""\documentclass[tikz,border=5pt]{standalone}
 \end{document}
 """
 
+@lru_cache(maxsize=None)
 def _which(cmd: str) -> bool:
+    # PATH is fixed for the life of the process; look each tool up once
     return shutil.which(cmd) is not None
 
+_ENV_RE = re.compile(r"\\(begin|end)\{([^}]*)\}")
+_COMMENT_RE = re.compile(r"(?<!\\)%.*")
+
+# Macro definitions may open and close environments in separate macros, which a
+# plain scan would misread as misnesting
+_MACRO_DEF_RE = re.compile(r"\\(?:(?:re)?newenvironment|(?:re|provide)?newcommand|[egx]?def)\b")
+
+def _postprocess(tikz_source: str) -> str:
+    """Lossless repairs for defects LLM output often has, each of which would otherwise
+    cost a failed LaTeX run and a repair round: text after ``\\end{document}`` (which
+    LaTeX ignores) is trimmed, and environments left open are closed. Nothing LaTeX
+    would typeset is removed. Returns the input unchanged when neither applies."""
+    lines = tikz_source.splitlines()
+    out = lines
+    changed = False
+    for i, line in enumerate(lines):
+        if line.strip().startswith("\\end{document}"):
+            if any(l.strip() for l in lines[i + 1:]):
+                out = lines[:i + 1]
+                changed = True
+            break
+
+    # Close environments left open, innermost first; give up if they are misnested or
+    # macro definitions might open them
+    code = _COMMENT_RE.sub("", "\n".join(out))
+    stack: List[str] = []
+    for kind, name in ([] if _MACRO_DEF_RE.search(code) else _ENV_RE.findall(code)):
+        if kind == "begin":
+            stack.append(name)
+        elif stack and stack[-1] == name:
+            stack.pop()
+        else:
+            stack = []
+            break
+    if stack:
+        out = out + [f"\\end{{{name}}}" for name in reversed(stack)]
+        changed = True
+
+    return "\n".join(out) if changed else tikz_source
+
+def _static_validate(doc: str) -> Optional[str]:
+    """Structural errors that make a compile certain to fail, as a LaTeX-style
+    "! ..." message, or None. Saves launching the toolchain for them."""
+    code = _COMMENT_RE.sub("", doc)
+    cls = code.find("\\documentclass")
+    begin_doc = code.find("\\begin{document}")
+    if cls == -1:
+        return "! LaTeX Error: Missing \\documentclass."
+    if begin_doc == -1:
+        return "! LaTeX Error: Missing \\begin{document}."
+    if begin_doc < cls:
+        return "! LaTeX Error: \\begin{document} appears before \\documentclass."
+    if _MACRO_DEF_RE.search(code):
+        return None
+    stack: List[Tuple[str, int]] = []
+    for m in _ENV_RE.finditer(code):
+        kind, name = m.groups()
+        line = code.count("\n", 0, m.start()) + 1
+        if kind == "begin":
+            stack.append((name, line))
+        elif not stack:
+            return f"! LaTeX Error: \\end{{{name}}} on input line {line} has no matching \\begin."
+        elif stack[-1][0] != name:
+            opened, opened_line = stack[-1]
+            return f"! LaTeX Error: \\begin{{{opened}}} on input line {opened_line} ended by \\end{{{name}}} on input line {line}."
+        else:
+            stack.pop()
+    if stack:
+        opened, opened_line = stack[-1]
+        return f"! LaTeX Error: \\begin{{{opened}}} on input line {opened_line} is never ended."
+    return None
+
 def _ensure_document(tikz_source: str) -> str:
     if "\\documentclass" in tikz_source:
         return tikz_source
@@ -41,107 +135,260 @@ def _ensure_document(tikz_source: str) -> str:
         tikz_source = f"\\begin{{tikzpicture}}\n{tikz_source}\n\\end{{tikzpicture}}"
     return _MIN_DOC % tikz_source
 
-def _run(cmd: List[str], cwd: str) -> Tuple[bool, bytes]:
+# Only the end of a tool's output is kept; LaTeX reports the fatal error last
+LOG_TAIL_BYTES = 16 * 1024
+
+def _tail(path: str, limit: int = LOG_TAIL_BYTES) -> bytes:
     try:
-        cp = subprocess.run(cmd, cwd=cwd, check=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=70)
-        return True, cp.stdout
-    except Exception as e:
-        return False, getattr(e, 'output', b'') or b''
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - limit))
+            return f.read()
+    except OSError:
+        return b''
+
+def _run(cmd: List[str], cwd: str, capture: bool = True) -> Tuple[bool, bytes]:
+    """Run a tool in ``cwd`` with its output streamed to a file there, not a pipe.
+
+    Returns (exit status was 0, tail of the combined stdout/stderr). With
+    ``capture=False`` the output is discarded and the tail is always empty.
+    """
+    out_path = os.path.join(cwd, f"{os.path.basename(cmd[0])}.out")
+    out = None
+    try:
+        out = open(out_path, "wb") if capture else subprocess.DEVNULL
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=out, stderr=subprocess.STDOUT)
+        try:
+            ok = proc.wait(timeout=70) == 0
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            ok = False
+    except Exception:
+        ok = False
+    finally:
+        if capture and out is not None:
+            out.close()
+    return ok, _tail(out_path) if capture else b''
 
 def _compile_pdf(td: str) -> Tuple[bool, str, bytes]:
     """Attempt multiple backends; return (ok, pdf_path, log)."""
     pdf_path = os.path.join(td, "main.pdf")
-    log_all = b''
+    log_all = bytearray()  # appended per tool run; copied to bytes once on return
     # tectonic first
     if _which("tectonic"):
         ok, out = _run(["tectonic", "--keep-intermediates", "--outdir", td, "main.tex"], td)
         log_all += out
         if ok and os.path.exists(pdf_path):
-            return True, pdf_path, log_all
+            return True, pdf_path, bytes(log_all)
     # latexmk
     if _which("latexmk"):
-        ok, out = _run(["latexmk", "-pdf", "-interaction=nonstopmode", "-halt-on-error", "main.tex"], td)
+        # -recorder keeps the dependency database that lets a reused workdir build incrementally
+        ok, out = _run(["latexmk", "-pdf", "-recorder", "-interaction=nonstopmode", "-halt-on-error", "main.tex"], td)
         log_all += out
         if ok and os.path.exists(pdf_path):
-            return True, pdf_path, log_all
+            return True, pdf_path, bytes(log_all)
     # pdflatex fallback
     if _which("pdflatex"):
         for _ in range(2):
             ok, out = _run(["pdflatex", "-interaction=nonstopmode", "main.tex"], td)
             log_all += out
+            # A second pass only matters when LaTeX asks for one (references, remember picture)
+            if not ok or b"Rerun" not in out:
+                break
         if os.path.exists(pdf_path):
-            return True, pdf_path, log_all
-    return False, pdf_path, log_all
+            return True, pdf_path, bytes(log_all)
+    return False, pdf_path, bytes(log_all)
+
+def _read_output(path: str) -> Optional[bytes]:
+    """Contents of a tool's output file, or None if it wasn't written."""
+    try:
+        return Path(path).read_bytes()
+    except OSError:
+        return None
+
+def _render_jpeg_pdfium(pdf_path: str, dpi: int = 150, quality: int = 90) -> bytes:
+    """First page as JPEG via pypdfium2, or b'' if it (or Pillow) is unavailable."""
+    try:
+        import pypdfium2 as pdfium  # optional
+    except ImportError:
+        return b''
+    try:
+        pdf = pdfium.PdfDocument(pdf_path)
+        try:
+            img = pdf[0].render(scale=dpi / 72).to_pil()
+        finally:
+            pdf.close()
+        buf = io.BytesIO()
+        img.convert("RGB").save(buf, format="JPEG", quality=quality)
+        return buf.getvalue()
+    except Exception:
+        return b''
 
 def _produce_jpeg_from_pdf(td: str, pdf_path: str) -> Tuple[bool, bytes]:
     """Try to rasterize first page of the PDF into a JPEG.
 
-    We intentionally avoid adding Python deps; rely on common CLI tools.
-    Returns (ok, bytes).
+    Renders in-process with pypdfium2 (+ Pillow) when installed; otherwise relies
+    on common CLI tools. Returns (ok, bytes).
     """
-    # 1. pdftoppm (poppler)
+    # 0. pypdfium2: no process spawn or intermediate file
+    jpeg = _render_jpeg_pdfium(pdf_path)
+    if jpeg:
+        return True, jpeg
+    cand = os.path.join(td, "main.jpg")
+    # 1. pdftoppm (poppler); -singlefile renders only the first page, named exactly main.jpg
     if _which("pdftoppm"):
-        # Limit to first page to avoid accidental multi-page output
-        ok, _ = _run(["pdftoppm", "-jpeg", "-f", "1", "-l", "1", pdf_path, "main"], td)
-        if ok:
-            # pdftoppm writes main-1.jpg (unless singlefile option available)
-            cand = os.path.join(td, "main.jpg")
-            if not os.path.exists(cand):
-                cand = os.path.join(td, "main-1.jpg")
-            if os.path.exists(cand):
-                return True, open(cand, "rb").read()
+        ok, _ = _run(["pdftoppm", "-jpeg", "-singlefile", pdf_path, "main"], td, capture=False)
+        data = _read_output(cand) if ok else None
+        if data is not None:
+            return True, data
     # 2. pdftocairo
     if _which("pdftocairo"):
-        # pdftocairo outputs main-1.jpg for first page unless -singlefile present
-        ok, _ = _run(["pdftocairo", "-jpeg", pdf_path, "main"], td)
-        if ok:
-            cand = os.path.join(td, "main.jpg")
-            if not os.path.exists(cand):
-                cand = os.path.join(td, "main-1.jpg")
-            if os.path.exists(cand):
-                return True, open(cand, "rb").read()
+        ok, _ = _run(["pdftocairo", "-jpeg", "-singlefile", pdf_path, "main"], td, capture=False)
+        data = _read_output(cand) if ok else None
+        if data is not None:
+            return True, data
     # 3. ImageMagick
     if _which("magick") or _which("convert"):
         tool = "magick" if _which("magick") else "convert"
-        ok, _ = _run([tool, "-density", "200", pdf_path, "-quality", "90", "main.jpg"], td)
-        if ok:
-            cand = os.path.join(td, "main.jpg")
-            if os.path.exists(cand):
-                return True, open(cand, "rb").read()
+        ok, _ = _run([tool, "-density", "200", pdf_path, "-quality", "90", "main.jpg"], td, capture=False)
+        data = _read_output(cand) if ok else None
+        if data is not None:
+            return True, data
     # 4. Ghostscript
     if _which("gs"):
         ok, _ = _run([
             "gs", "-sDEVICE=jpeg", "-dBATCH", "-dNOPAUSE", "-dSAFER", "-r200",
             "-sOutputFile=main.jpg", pdf_path
-        ], td)
-        if ok:
-            cand = os.path.join(td, "main.jpg")
-            if os.path.exists(cand):
-                return True, open(cand, "rb").read()
+        ], td, capture=False)
+        data = _read_output(cand) if ok else None
+        if data is not None:
+            return True, data
     return False, b""
 
-def tikz_to_formats(tikz_source: str, formats: Iterable[str] = ("tikz", "pdf")) -> Dict[str, bytes]:
+def _cache_key(doc: str) -> str:
+    return hashlib.blake2b(doc.encode("utf-8"), digest_size=20).hexdigest()
+
+def _cache_load(key: str, wanted: List[str]) -> Optional[Dict[str, bytes]]:
+    """Cached pdf/jpeg/log for ``key`` if every wanted format is present, else None."""
+    if not CACHE_DIR:
+        return None
+    entry = os.path.join(CACHE_DIR, key)
+    outputs: Dict[str, bytes] = {}
+    for fmt, name in _CACHE_FILES.items():
+        try:
+            with open(os.path.join(entry, name), "rb") as f:
+                outputs[fmt] = f.read()
+        except OSError:
+            if fmt in wanted:
+                return None
+    try:
+        os.utime(entry)  # mtime is the eviction order
+    except OSError:
+        pass
+    return outputs
+
+def _cache_store(key: str, outputs: Dict[str, bytes]) -> None:
+    """Persist compiled outputs (best-effort) and evict the least recently used entries."""
+    if not CACHE_DIR:
+        return
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=f".{key}.", dir=CACHE_DIR)
+        for fmt, name in _CACHE_FILES.items():
+            if fmt in outputs:
+                with open(os.path.join(tmp, name), "wb") as f:
+                    f.write(outputs[fmt])
+        entry = os.path.join(CACHE_DIR, key)
+        # Replace any older entry (e.g. one without a JPEG) in one rename
+        shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.replace(tmp, entry)
+        except OSError:
+            # Another process stored the same key first
+            shutil.rmtree(tmp, ignore_errors=True)
+        entries = [e for e in os.scandir(CACHE_DIR) if e.is_dir() and not e.name.startswith(".")]
+        if len(entries) > CACHE_MAX_ENTRIES:
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for e in entries[:len(entries) - CACHE_MAX_ENTRIES]:
+                shutil.rmtree(e.path, ignore_errors=True)
+    except OSError:
+        pass
+
+def _compile_in(td: str, doc: str, key: str, wanted: List[str], outputs: Dict[str, bytes]) -> bool:
+    """Compile ``doc`` in directory ``td``, adding log/pdf/jpeg to ``outputs``.
+    Returns whether a PDF was produced."""
+    error = _static_validate(doc)
+    if error:
+        # Report it the way LaTeX would, without launching the toolchain
+        outputs["log"] = f"main.tex: static check failed\n{error}\n".encode("utf-8")
+        return False
+    with open(os.path.join(td, "main.tex"), "w", encoding="utf-8") as f:
+        f.write(doc)
+    ok_pdf, pdf_path, log_bytes = _compile_pdf(td)
+    outputs["log"] = log_bytes  # Always include log, even if PDF fails
+    pdf_bytes = _read_output(pdf_path) if ok_pdf else None
+    if pdf_bytes is not None:
+        if "pdf" in wanted:
+            outputs["pdf"] = pdf_bytes
+        if "jpeg" in wanted:
+            ok_jpeg, jpeg_bytes = _produce_jpeg_from_pdf(td, pdf_path)
+            if ok_jpeg:
+                outputs["jpeg"] = jpeg_bytes
+        # Only successful compiles are cached; failures may be transient (timeouts)
+        if all(f in outputs for f in wanted):
+            _cache_store(key, outputs)
+    # else fall back silently
+    return pdf_bytes is not None
+
+# Outputs a previous compile may have left in a reused working directory
+_STALE_OUTPUTS = ("main.pdf", "main.jpg")
+
+def _remove_build_files(workdir: str, names: Optional[Iterable[str]] = None) -> None:
+    """Delete ``names`` from ``workdir``; by default every main.* file but main.tex."""
+    if names is None:
+        try:
+            names = [n for n in os.listdir(workdir) if n.startswith("main.") and n != "main.tex"]
+        except OSError:
+            return
+    for name in names:
+        try:
+            os.remove(os.path.join(workdir, name))
+        except OSError:
+            pass
+
+def tikz_to_formats(tikz_source: str, formats: Iterable[str] = ("tikz", "pdf"), workdir: Optional[str] = None) -> Dict[str, bytes]:
+    """Convert TikZ to the requested formats (always including the raw source).
+
+    ``workdir`` reuses a caller-owned directory across sequential compiles so the
+    toolchain's auxiliary files (.aux, .fls, .fdb_latexmk) carry over between
+    retries; they are only kept after a successful compile, since a failed run's
+    can break the next one. Without it each call compiles in a fresh temporary
+    directory. A workdir must not be shared by concurrent calls.
+    """
     wanted = list(dict.fromkeys(formats))  # preserve order unique
+    tikz_source = _postprocess(tikz_source)
     outputs: Dict[str, bytes] = {"tikz": tikz_source.encode("utf-8")}
     need_pdf = any(f in ("pdf", "jpeg") for f in wanted)
-    log_bytes = b''
     if not need_pdf:
         return {k: v for k, v in outputs.items() if k in wanted}
 
     doc = _ensure_document(tikz_source)
-    with tempfile.TemporaryDirectory(prefix="archgen_tikz_") as td:
-        with open(os.path.join(td, "main.tex"), "w", encoding="utf-8") as f:
-            f.write(doc)
-        ok_pdf, pdf_path, log_bytes = _compile_pdf(td)
-        outputs["log"] = log_bytes  # Always include log, even if PDF fails
-        if ok_pdf and os.path.exists(pdf_path):
-            if "pdf" in wanted:
-                outputs["pdf"] = open(pdf_path, "rb").read()
-            if "jpeg" in wanted:
-                ok_jpeg, jpeg_bytes = _produce_jpeg_from_pdf(td, pdf_path)
-                if ok_jpeg:
-                    outputs["jpeg"] = jpeg_bytes
-        # else fall back silently
+    key = _cache_key(doc)
+    cached = _cache_load(key, wanted)
+    if cached is not None:
+        outputs.update(cached)
+        return {k: v for k, v in outputs.items() if k in wanted or k == "log"}
+
+    if workdir:
+        os.makedirs(workdir, exist_ok=True)
+        # A leftover PDF/JPEG would pass for this compile's output
+        _remove_build_files(workdir, _STALE_OUTPUTS)
+        if not _compile_in(workdir, doc, key, wanted, outputs):
+            _remove_build_files(workdir)
+    else:
+        with tempfile.TemporaryDirectory(prefix="archgen_tikz_") as td:
+            _compile_in(td, doc, key, wanted, outputs)
 
     return {k: v for k, v in outputs.items() if k in wanted or k == "log"}
 
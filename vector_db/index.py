@@ -1,12 +1,10 @@
-from llama_index.core import SimpleDirectoryReader, Document, StorageContext
-from llama_index.core import VectorStoreIndex
-from llama_index.vector_stores.supabase import SupabaseVectorStore
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.core import Settings
-
-import torch
+# llama_index, torch and the embedding stack are imported on the init thread (and
+# in the functions that need them), so importing this module stays cheap
 import os
+import hashlib
 import threading
+from functools import cache
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit, urlunsplit
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -21,10 +19,123 @@ VECTOR_DB_READY = False
 VECTOR_DB_ERROR = None
 vector_store = None
 index = None
+# Same collection over a separate connection pool for inserts and index DDL, which get
+# a longer statement timeout than queries
+_ingest_index = None
+# Set once initialization has finished, whether it succeeded or failed
+VECTOR_DB_INIT_DONE = threading.Event()
+EMBED_BATCH_SIZE = 64
+# How long add_documents_to_vector_db waits for a still-running initialization
+INIT_WAIT_SECONDS = 30
+
+# Folder holding an ONNX export of the embedding model, e.g. from
+# `optimum-cli export onnx --model BAAI/bge-small-en-v1.5 --task feature-extraction <dir>`
+# (optionally quantized with `optimum-cli onnxruntime quantize`). ONNX Runtime encodes
+# several times faster than PyTorch eager on CPU. Requires
+# llama-index-embeddings-huggingface-optimum; unset uses the PyTorch model.
+ONNX_EMBED_DIR = os.environ.get("ARCHGEN_ONNX_EMBED_DIR", "")
+
+# Postgres cancels statements running longer than these: queries match the RAG query
+# timeout, while bulk upserts and index builds scale with the collection
+STATEMENT_TIMEOUT_SECONDS = 60
+MAINTENANCE_STATEMENT_TIMEOUT_SECONDS = 1800
+
+# Content hashes of documents ingested by this process, used to skip re-uploads
+_ingested_ids = set()
+_ingest_lock = threading.Lock()
+# Bumped after every successful insert so cached retrievals from before it are not reused
+INGEST_GENERATION = 0
+
+
+def _onnx_embed_model():
+    """ONNX Runtime embedding model from ONNX_EMBED_DIR, or None if unset or unavailable."""
+    if not ONNX_EMBED_DIR:
+        return None
+    try:
+        from llama_index.embeddings.huggingface_optimum import OptimumEmbedding
+        embed_model = OptimumEmbedding(folder_name=ONNX_EMBED_DIR, embed_batch_size=EMBED_BATCH_SIZE)
+    except Exception as e:
+        print(f"[ERROR] Could not load ONNX embedding model, using PyTorch: {e}")
+        return None
+    print(f"[DEBUG] Using ONNX embedding model from {ONNX_EMBED_DIR}")
+    return embed_model
+
+@cache
+def _get_embed_model():
+    """The embedding model, built on first use: the ONNX export if configured, else the
+    HuggingFace model on the best available device."""
+    onnx_model = _onnx_embed_model()
+    if onnx_model is not None:
+        return onnx_model
+
+    import torch
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    if torch.cuda.is_available():
+        device = "cuda"
+    elif torch.backends.mps.is_available():
+        device = "mps"
+    else:
+        device = "cpu"
+    print(f"[DEBUG] Using device: {device}")
+
+    embed_model = HuggingFaceEmbedding(
+        model_name="BAAI/bge-small-en-v1.5",
+        device=device,
+        # Bulk uploads embed their chunks in one insert_nodes call; larger forward
+        # batches keep the matmuls busy (the library default is 10)
+        embed_batch_size=EMBED_BATCH_SIZE,
+    )
+    if device == "cuda":
+        # Half precision roughly doubles GPU encode throughput; outputs are still
+        # L2-normalized, and cosine drift against fp32-stored rows is negligible
+        try:
+            embed_model._model.half()
+        except Exception as e:
+            print(f"[ERROR] Could not switch embedding model to fp16: {e}")
+    return embed_model
+
+def _with_statement_timeout(dsn, seconds):
+    """``dsn`` with a server-side statement_timeout, unless it already sets options.
+
+    Client-side timeouts only stop waiting; this makes Postgres cancel a slow query
+    and release its connection.
+    """
+    parts = urlsplit(dsn)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if any(name == "options" for name, _ in query):
+        return dsn
+    query.append(("options", f"-c statement_timeout={seconds * 1000}"))
+    return urlunsplit(parts._replace(query=urlencode(query, quote_via=quote)))
+
+def _ensure_ann_index(store):
+    """Create the collection's ANN index once at startup if it has none yet.
+
+    Without one pgvector answers every query with an exact scan. This runs here rather
+    than per query because it is DDL; failures are logged and retrieval still works.
+    """
+    collection = getattr(store, "_collection", None)
+    if collection is None:
+        return
+    try:
+        if collection.index is None:
+            # The same measure SupabaseVectorStore queries with, so the planner uses it
+            collection.create_index(measure="cosine_distance", replace=False)
+            print("[DEBUG] Created vector index on the collection.")
+    except Exception as e:
+        print(f"[ERROR] Could not create vector index: {e}")
 
+def _warm_up(idx):
+    """Run one throwaway retrieval so the first real query doesn't pay for the model's
+    first forward pass and the DB connection pool being opened."""
+    try:
+        idx.as_retriever(similarity_top_k=1).retrieve("warmup")
+        print("[DEBUG] Vector DB warm-up query done.")
+    except Exception as e:
+        print(f"[ERROR] Vector DB warm-up failed: {e}")
 
 def _init_vector_db():
-    global VECTOR_DB_READY, VECTOR_DB_ERROR, vector_store, index
+    global VECTOR_DB_READY, VECTOR_DB_ERROR, vector_store, index, _ingest_index
     try:
         print("[DEBUG] Starting vector database initialization...")
         DB_CONNECTION = os.getenv("DB_CONNECTION")
@@ -37,39 +148,40 @@ def _init_vector_db():
 
         print("[DEBUG] Environment variables loaded successfully.")
 
+        from llama_index.core import Settings, VectorStoreIndex
+        from llama_index.vector_stores.supabase import SupabaseVectorStore
+
         # Set HuggingFace embedding model globally
-        if torch.cuda.is_available():
-            device = "cuda"
-        elif torch.backends.mps.is_available():
-            device = "mps"
-        else:
-            device = "cpu"
-        print(f"[DEBUG] Using device: {device}")
-
-        embed_model = HuggingFaceEmbedding(
-            model_name="BAAI/bge-small-en-v1.5",
-            device=device
-        )
-        Settings.embed_model = embed_model
+        Settings.embed_model = _get_embed_model()
         print("[DEBUG] HuggingFace embedding model initialized.")
 
         # Explicitly disable default LLM usage to avoid OpenAI attempts
         Settings.llm = None
 
+        ingest_store = SupabaseVectorStore(
+            postgres_connection_string=_with_statement_timeout(DB_CONNECTION, MAINTENANCE_STATEMENT_TIMEOUT_SECONDS),
+            collection_name=COLLECTION_NAME
+        )
+        _ensure_ann_index(ingest_store)
+        _ingest_index = VectorStoreIndex.from_vector_store(ingest_store)
+
         vector_store = SupabaseVectorStore(
-            postgres_connection_string=DB_CONNECTION,
+            postgres_connection_string=_with_statement_timeout(DB_CONNECTION, STATEMENT_TIMEOUT_SECONDS),
             collection_name=COLLECTION_NAME
         )
         print("[DEBUG] SupabaseVectorStore initialized.")
 
         index = VectorStoreIndex.from_vector_store(vector_store)
         print("[DEBUG] VectorStoreIndex created successfully.")
+        _warm_up(index)
 
         print("Connected to Supabase vector store.")
         VECTOR_DB_READY = True
     except Exception as e:
         VECTOR_DB_ERROR = str(e)
         print(f"[ERROR] Error initializing Supabase vector DB: {e}")
+    finally:
+        VECTOR_DB_INIT_DONE.set()
 
 # Start connection in background
 threading.Thread(target=_init_vector_db, daemon=True).start()
@@ -80,19 +192,53 @@ def is_vector_db_ready():
 def get_vector_db_error():
     return VECTOR_DB_ERROR
 
+def is_vector_db_init_done():
+    return VECTOR_DB_INIT_DONE.is_set()
+
 def add_documents_to_vector_db(documents):
     """Add documents to the Supabase vector database."""
+    VECTOR_DB_INIT_DONE.wait(timeout=INIT_WAIT_SECONDS)
     if not VECTOR_DB_READY:
         raise RuntimeError("Vector DB is not ready yet.")
     if VECTOR_DB_ERROR:
         raise RuntimeError(f"Vector DB error: {VECTOR_DB_ERROR}")
+    from llama_index.core import Document, Settings
+    from llama_index.core.ingestion import run_transformations
+
     print("Adding documents to the vector database...")
     try:
-        # Convert documents to the required format
-        formatted_documents = [Document(text=doc) for doc in documents if doc.strip()]
+        # Convert documents to the required format, keyed by content hash so
+        # duplicates within the batch and earlier uploads are skipped
+        formatted_documents = []
+        with _ingest_lock:
+            for doc in documents:
+                text = doc.strip()
+                if not text:
+                    continue
+                doc_id = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                if doc_id in _ingested_ids:
+                    continue
+                _ingested_ids.add(doc_id)
+                formatted_documents.append(Document(text=doc, id_=doc_id))
         print(f"Prepared {len(formatted_documents)} documents for insertion.")
-        for doc in formatted_documents:
-            index.insert(doc)
+        if not formatted_documents:
+            return 0
+        try:
+            # Chunk everything up front so insert_nodes embeds the whole upload in batches
+            nodes = run_transformations(formatted_documents, Settings.transformations)
+            # Deterministic node ids make re-uploads after a restart upsert existing rows
+            chunk_counts = {}
+            for node in nodes:
+                chunk = chunk_counts.get(node.ref_doc_id, 0)
+                chunk_counts[node.ref_doc_id] = chunk + 1
+                node.id_ = f"{node.ref_doc_id}-{chunk}"
+            _ingest_index.insert_nodes(nodes)
+        except Exception:
+            with _ingest_lock:
+                _ingested_ids.difference_update(d.doc_id for d in formatted_documents)
+            raise
+        global INGEST_GENERATION
+        INGEST_GENERATION += 1
         print("Documents added to the vector database.")
         return len(formatted_documents)
     except Exception as e:
@@ -1,40 +1,262 @@
+from constants import VERBOSE_LOGS
 from vector_db import index as vindex
 from llama_index.core import Settings
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from collections import OrderedDict
+from functools import lru_cache
+import asyncio
+import queue
+import threading
+import time
+
+# Recent retrievals keyed on (normalized query, top_k, ingest generation); agents
+# often repeat the same search across critique rounds. Entries also expire after
+# RAG_CACHE_TTL seconds so rows written by other processes are picked up.
+RAG_CACHE_SIZE = 256
+RAG_CACHE_TTL = 600
+_rag_cache = OrderedDict()  # key -> (stored_at, text)
+_rag_cache_lock = threading.Lock()
+
+# Shared pool the retrievals run on (so they can be timed out); reused across calls,
+# and wide enough that concurrent sessions' searches don't queue behind each other
+RAG_MAX_WORKERS = 4
+_RAG_POOL = ThreadPoolExecutor(max_workers=RAG_MAX_WORKERS, thread_name_prefix="archgen_rag")
+
+# Query embeddings arriving within EMBED_BATCH_WINDOW seconds of each other are
+# embedded together, up to EMBED_MAX_BATCH per forward pass
+EMBED_MAX_BATCH = 32
+EMBED_BATCH_WINDOW = 0.005
+
+# top_k -> (index, retriever); an entry is rebuilt if vindex.index was replaced
+_retrievers = {}
+_retriever_lock = threading.Lock()
+
+# Latched by _not_ready_message once the vector DB and embedding model are usable
+_rag_ready = False
+
+def clear_rag_cache():
+    """Drop all cached retrievals (e.g. after the vector store was rebuilt)."""
+    with _rag_cache_lock:
+        _rag_cache.clear()
+
+def _cache_key(query: str, top_k: int):
+    return (" ".join(query.split()).lower(), top_k, vindex.INGEST_GENERATION)
+
+def _cache_get(key, now: float):
+    with _rag_cache_lock:
+        entry = _rag_cache.get(key)
+        if entry is not None:
+            if now - entry[0] < RAG_CACHE_TTL:
+                _rag_cache.move_to_end(key)
+                return entry[1]
+            del _rag_cache[key]
+    return None
+
+def _cache_put(key, now: float, result: str) -> None:
+    with _rag_cache_lock:
+        _rag_cache[key] = (now, result)
+        while len(_rag_cache) > RAG_CACHE_SIZE:
+            _rag_cache.popitem(last=False)
 
 def perform_rag(query: str, top_k: int = 5):
     """
     Perform Retrieval-Augmented Generation (RAG) using the vector index.
     """
+    key = _cache_key(query, top_k)
+    now = time.monotonic()
+    cached = _cache_get(key, now)
+    if cached is not None:
+        return cached
+    result, ok = _perform_rag(query, top_k)
+    if ok:
+        _cache_put(key, now, result)
+    return result
+
+async def aperform_rag(query: str, top_k: int = 5):
+    """Async variant of :func:`perform_rag` for callers already on an event loop.
+
+    The retrieval runs on the shared RAG pool and is awaited, so the loop stays free.
+    A timeout only stops the wait; the worker keeps running until Postgres ends the
+    query through its statement_timeout.
+    """
+    key = _cache_key(query, top_k)
+    now = time.monotonic()
+    cached = _cache_get(key, now)
+    if cached is not None:
+        return cached
+    result, ok = await _aperform_rag(query, top_k)
+    if ok:
+        _cache_put(key, now, result)
+    return result
+
+def _query_batch_prefix(embed_model):
+    """Prefix that makes ``get_text_embedding_batch([prefix + q])`` equal
+    ``get_query_embedding(q)``, or None if the two paths can't be reconciled.
+
+    The HuggingFace (and Optimum) embeddings prepend a per-model query instruction to
+    queries (for BGE: "Represent this question for searching relevant passages: ") and
+    a text instruction to texts, unless given explicit ones.
+    """
+    try:
+        from llama_index.embeddings.huggingface.utils import (
+            get_query_instruct_for_model_name,
+            get_text_instruct_for_model_name,
+        )
+        model_name = embed_model.model_name
+        query_instruction = getattr(embed_model, "query_instruction", None)
+        if query_instruction is None:
+            query_instruction = get_query_instruct_for_model_name(model_name)
+        text_instruction = getattr(embed_model, "text_instruction", None)
+        if text_instruction is None:
+            text_instruction = get_text_instruct_for_model_name(model_name)
+    except Exception:
+        return None
+    if text_instruction:
+        return None
+    return query_instruction or ""
+
+def _embed_queries(queries):
+    """Query embeddings for ``queries``, in one forward pass when the model allows it."""
+    embed_model = Settings.embed_model
+    prefix = _query_batch_prefix(embed_model)
+    if prefix is None:
+        return [embed_model.get_query_embedding(q) for q in queries]
+    return embed_model.get_text_embedding_batch([prefix + q for q in queries])
+
+class _EmbedBatcher:
+    """Coalesces query embeddings requested at about the same time into one call of
+    ``embed_batch``; concurrent sessions' searches otherwise each run a batch of one."""
+
+    def __init__(self, embed_batch, max_batch: int, window: float):
+        self._embed_batch = embed_batch
+        self._queue = queue.Queue()
+        self._max_batch = max_batch
+        self._window = window
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def embed(self, text: str):
+        future = Future()
+        self._queue.put((text, future))
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True, name="archgen_embed")
+                self._worker.start()
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._window
+            while len(batch) < self._max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                embeddings = self._embed_batch([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
+_embed_batcher = _EmbedBatcher(_embed_queries, EMBED_MAX_BATCH, EMBED_BATCH_WINDOW)
+
+@lru_cache(maxsize=2048)
+def _query_embedding(query: str) -> tuple:
+    """Embedding of a query string; the model forward pass dominates a retrieval, and
+    repeats with a different top_k (or after the result cache dropped them) reuse it."""
+    return tuple(_embed_batcher.embed(query))
+
+def _get_retriever(top_k: int):
+    """Retriever for ``top_k``, built once per index and reused across queries."""
+    from llama_index.core.retrievers import VectorIndexRetriever
+
+    index = vindex.index
+    with _retriever_lock:
+        entry = _retrievers.get(top_k)
+        if entry is None or entry[0] is not index:
+            entry = (index, VectorIndexRetriever(index=index, similarity_top_k=top_k, embed_model=Settings.embed_model))
+            _retrievers[top_k] = entry
+    return entry[1]
+
+def _join_nodes(nodes) -> str:
+    return "\n\n".join(node.node.get_content() for node in nodes)
+
+def _retrieve(query: str, top_k: int):
+    """Nodes most similar to ``query``, embedded through the cache. Retrieval only: the
+    callers want the source texts, so no query engine or response synthesis is built."""
+    from llama_index.core import QueryBundle
+
+    return _get_retriever(top_k).retrieve(QueryBundle(query_str=query, embedding=list(_query_embedding(query))))
+
+def _not_ready_message():
+    """Why retrieval can't run right now, or None if the vector DB is usable."""
+    global _rag_ready
+    if _rag_ready:
+        return None
     if (
         not vindex.is_vector_db_ready()
         or vindex.vector_store is None
         or vindex.index is None
-        or type(Settings.embed_model) != HuggingFaceEmbedding
+        # Guards against llama_index's default (OpenAI) embeddings being used
+        or Settings.embed_model is not vindex._get_embed_model()
     ):
         error = vindex.get_vector_db_error()
         return "Vector DB is not ready. Please try again later." if not error else f"Vector DB error: {error}"
+    # Initialization only ever goes from not ready to ready, so check once
+    _rag_ready = True
+    return None
+
+def _perform_rag(query: str, top_k: int):
+    """Run the retrieval; returns (text, succeeded) so only real results get cached."""
+    not_ready = _not_ready_message()
+    if not_ready:
+        return not_ready, False
 
-    print(f"===== Performing RAG =====\nQuery: {query}\nTop K: {top_k}")
+    if VERBOSE_LOGS:
+        print(f"===== Performing RAG =====\nQuery: {query}\nTop K: {top_k}")
     try:
-        query_engine = vindex.index.as_query_engine(
-            llm=None,
-            embed_model=Settings.embed_model,
-            similarity_top_k=top_k,
-        )
+        # Run on the shared pool to enforce a timeout on the query
+        future = _RAG_POOL.submit(_retrieve, query, top_k)
+        try:
+            nodes = future.result(timeout=60)  # Timeout after 60 seconds
+        except TimeoutError:
+            print("Error: RAG query timed out.")
+            return "Error: RAG query timed out.", False
 
-        # Use a thread pool to enforce a timeout on the query
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(query_engine.query, query)
-            try:
-                response = future.result(timeout=60)  # Timeout after 60 seconds
-            except TimeoutError:
-                print("Error: RAG query timed out.")
-                return "Error: RAG query timed out."
+        return _join_nodes(nodes), True
+    except Exception as e:
+        print(f"Error during RAG query: {e}")
+        return f"Error during RAG query: {e}", False
+
+async def _aperform_rag(query: str, top_k: int):
+    """Async counterpart of :func:`_perform_rag`, returning the same (text, succeeded)."""
+    not_ready = _not_ready_message()
+    if not_ready:
+        return not_ready, False
 
-        docs = [node.node.get_content() for node in response.source_nodes]
-        return "\n\n".join(docs)
+    if VERBOSE_LOGS:
+        print(f"===== Performing RAG =====\nQuery: {query}\nTop K: {top_k}")
+    try:
+        # SupabaseVectorStore has no native async query (its aquery just calls the
+        # blocking one), so retrieve on the shared pool to keep the event loop free.
+        # A timed-out query is ended by the server-side statement_timeout
+        loop = asyncio.get_running_loop()
+        try:
+            nodes = await asyncio.wait_for(loop.run_in_executor(_RAG_POOL, _retrieve, query, top_k), timeout=60)
+        except asyncio.TimeoutError:
+            print("Error: RAG query timed out.")
+            return "Error: RAG query timed out.", False
+
+        return _join_nodes(nodes), True
     except Exception as e:
         print(f"Error during RAG query: {e}")
-        return f"Error during RAG query: {e}"
+        return f"Error during RAG query: {e}", False
+
+__all__ = ["perform_rag", "aperform_rag", "clear_rag_cache"]